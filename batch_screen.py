@@ -0,0 +1,207 @@
+"""
+Headless run of the financial analysis screen, e.g. on a schedule.
+
+    python batch_screen.py --universe value growth --excel out.xlsx
+    python batch_screen.py --us AAPL,MSFT --jp 7203.T --condition us=0.03,-0.5,0.1,0.4 --parquet out.parquet
+    python batch_screen.py --universe value growth --arrow out.arrow --csv out.csv --jsonl out.jsonl
+    python batch_screen.py --universe watchlist --valuation-only --csv out.csv  # quick valuation screen
+
+Large universes can be split in shards, each fetched and computed by its own process or node:
+
+    python batch_screen.py --universe value --shards 8 --workers 4 --excel out.xlsx   # all shards here, then merge
+    python batch_screen.py --universe value --shards 8 --shard 3 --shard-dir /mnt/shards  # on node 3
+    python batch_screen.py --universe value --shards 8 --merge --shard-dir /mnt/shards --excel out.xlsx
+
+A failed shard leaves no partial result, re-run it with --shard and merge again. Add --stream to write the workbook
+of a very large universe in bounded memory.
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from main.constants import c_text
+from main.layout.layout_output_data import LayoutOutputData
+from main.util.exporter import EXPORT_FORMAT_DICT
+from main.util.screen_pipeline import ScreenPipeline, UNIVERSE_ENV_DICT
+from main.util.shard import clear_partials, missing_shard_ls, shard_path
+from main.util.sqlite_store import get_store_dir
+
+SHEET_ARG_DICT = {prefix.lower(): sheetname for sheetname, prefix in UNIVERSE_ENV_DICT.items()}
+REGION_ARG_DICT = {'us': c_text.LABEL__US, 'cn': c_text.LABEL__CN, 'jp': c_text.LABEL__JP}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Screen tickers and write the formatted Excel / raw table output.')
+
+    parser.add_argument('--universe', nargs='+', choices=list(SHEET_ARG_DICT),
+                        help='Screen the {VALUE,GROWTH,THEME,WATCHLIST}__{US,CN,JP}_TICKERS env universes.')
+    parser.add_argument('--us', default='', help='Comma separated US tickers.')
+    parser.add_argument('--cn', default='', help='Comma separated China tickers.')
+    parser.add_argument('--jp', default='', help='Comma separated tickers of other regions.')
+    parser.add_argument('--sheet', choices=list(SHEET_ARG_DICT), default='watchlist',
+                        help='Sheet of the --us / --cn / --jp tickers.')
+    parser.add_argument('--condition', action='append', default=[], metavar='REGION=DIV,CAPEX,EPS,GM',
+                        help='Highlight thresholds of a region (us, cn, jp), can be repeated.')
+
+    parser.add_argument('--excel', help='Formatted workbook path.')
+    parser.add_argument('--parquet', help='Raw output table path, Parquet.')
+    parser.add_argument('--arrow', help='Raw output table path, Arrow IPC file.')
+    parser.add_argument('--csv', help='Raw output table path, CSV.')
+    parser.add_argument('--jsonl', help='Raw output table path, JSON lines.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the workbook to its file in constant memory, for very large universes.')
+
+    parser.add_argument('--valuation-only', action='store_true',
+                        help='Only fetch and compute the valuation ratios, the other columns are left blank.')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached data.')
+    parser.add_argument('--max-concurrency', type=int, help='Max concurrent requests (per shard).')
+
+    parser.add_argument('--shards', type=int, default=1, help='Split the universe in this many shards.')
+    parser.add_argument('--shard', type=int, nargs='+', help='Only run these shards (0-based) and write their partial results.')
+    parser.add_argument('--merge', action='store_true', help='Only merge the partial results of every shard.')
+    parser.add_argument('--shard-dir', help='Directory of the partial results. Default is {FMP_STORE_DIR}/shards.')
+    parser.add_argument('--workers', type=int, help='Processes running the shards. Default is one per shard.')
+
+    args = parser.parse_args(argv)
+    if args.universe is None and not (args.us or args.cn or args.jp):
+        parser.error('either --universe or at least one of --us / --cn / --jp is required')
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+    if args.shard is not None and any(not 0 <= i < args.shards for i in args.shard):
+        parser.error(f'--shard must be between 0 and {args.shards - 1}')
+    if args.shard is not None and args.merge:
+        parser.error('--shard and --merge are exclusive')
+
+    return args
+
+
+def parse_condition(arg_ls):
+    fmt_condition = ScreenPipeline.default_fmt_condition()
+    for arg in arg_ls:
+        region, _, value = arg.partition('=')
+        cond = fmt_condition[REGION_ARG_DICT[region.strip().lower()]]
+        cond.div, cond.capex, cond.eps, cond.gm = value.split(',')
+        cond.to_float()
+
+    return fmt_condition
+
+
+def build_pipeline(args) -> ScreenPipeline:
+    col_ls = LayoutOutputData.col_valuation_order if args.valuation_only else None
+    if args.universe is not None:
+        return ScreenPipeline.from_env([SHEET_ARG_DICT[u] for u in args.universe], force_refresh=args.refresh,
+                                       col_ls=col_ls)
+
+    return ScreenPipeline.from_tickers(args.us, args.cn, args.jp, sheetname=SHEET_ARG_DICT[args.sheet],
+                                       force_refresh=args.refresh, col_ls=col_ls)
+
+
+def run_shard(args, shard):
+    """Fetch and compute one shard, write its partial result. Runs in a worker process."""
+    load_dotenv()
+
+    def _show_progress(n_done, n_total):
+        if n_done == n_total or n_done % 100 == 0:
+            print(f'[shard {shard}] Fetching financial statements ({n_done}/{n_total} requests)', file=sys.stderr)
+
+    pipeline = build_pipeline(args)
+    pipeline.run(on_progress=_show_progress, max_concurrency=args.max_concurrency, shard=shard, n_shard=args.shards)
+
+    path = shard_path(args.shard_dir, shard, args.shards)
+    pipeline.save_partial(path, shard, args.shards)
+    print(f'[shard {shard}] Wrote {path} ({len(pipeline.ticker_ls)} tickers)', file=sys.stderr)
+
+    return shard
+
+
+def run_shards(args, shard_ls):
+    """Run shards in worker processes, return the shards that failed."""
+    failed_shard_ls = []
+    with ProcessPoolExecutor(max_workers=args.workers or len(shard_ls)) as executor:
+        future_dict = {executor.submit(run_shard, args, shard): shard for shard in shard_ls}
+        for future, shard in future_dict.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f'[shard {shard}] Failed: {e!r}', file=sys.stderr)
+                failed_shard_ls.append(shard)
+
+    return failed_shard_ls
+
+
+def write_output(args, pipeline: ScreenPipeline, raw_data_df, fmt_condition):
+    if len(pipeline.not_found_ticker_ls) > 0:
+        print(f'{c_text.ERR__TICKER_NOT_FOUND}: {pipeline.not_found_ticker_ls}', file=sys.stderr)
+    if len(pipeline.stale_ticker_ls) > 0:
+        print(f'{c_text.ERR__STALE_STATEMENT}: {pipeline.stale_ticker_ls}', file=sys.stderr)
+
+    if raw_data_df is None:
+        print(c_text.ERR__EMPTY_INPUT, file=sys.stderr)
+        return 1
+
+    fmt_dt = dt.datetime.now().strftime('%Y-%m-%d')
+    export_dict = {fmt: getattr(args, fmt) for fmt in EXPORT_FORMAT_DICT if getattr(args, fmt)}
+    excel_path = args.excel or (None if export_dict else f'financial_data_formatted__{fmt_dt}.xlsx')
+
+    if excel_path:
+        if args.stream:
+            pipeline.stream_excel(raw_data_df, fmt_condition, excel_path)
+        else:
+            with open(excel_path, 'wb') as f:
+                f.write(pipeline.to_excel(raw_data_df, fmt_condition))
+        print(f'Wrote {excel_path}', file=sys.stderr)
+
+    for fmt, path in export_dict.items():
+        pipeline.export_table(raw_data_df, path, fmt)
+        print(f'Wrote {path}', file=sys.stderr)
+
+    return 0
+
+
+def main(argv=None):
+    load_dotenv()
+
+    args = parse_args(argv)
+    fmt_condition = parse_condition(args.condition)
+
+    if args.shards == 1 and args.shard is None and not args.merge:
+        def _show_progress(n_done, n_total):
+            if n_done == n_total or n_done % 100 == 0:
+                print(f'Fetching financial statements ({n_done}/{n_total} requests)', file=sys.stderr)
+
+        pipeline = build_pipeline(args)
+        raw_data_df = pipeline.run(on_progress=_show_progress, max_concurrency=args.max_concurrency)
+
+        return write_output(args, pipeline, raw_data_df, fmt_condition)
+
+    args.shard_dir = args.shard_dir or os.path.join(get_store_dir(), 'shards')
+
+    # Worker mode: only the given shards, merged later by another call
+    if args.shard is not None:
+        failed_shard_ls = run_shards(args, args.shard)
+        return 1 if len(failed_shard_ls) > 0 else 0
+
+    # Every shard on this host, partial results of a previous run are not mixed in
+    if not args.merge:
+        clear_partials(args.shard_dir, args.shards)
+        run_shards(args, list(range(args.shards)))
+
+    missing_ls = missing_shard_ls(args.shard_dir, args.shards)
+    if len(missing_ls) > 0:
+        shard_arg = ' '.join(str(i) for i in missing_ls)
+        print(f'No partial result for shards {missing_ls}, re-run them with --shard {shard_arg} then --merge',
+              file=sys.stderr)
+        return 1
+
+    pipeline = build_pipeline(args)
+    pipeline.merge_partials([shard_path(args.shard_dir, i, args.shards) for i in range(args.shards)])
+
+    return write_output(args, pipeline, pipeline.build_dataframe(), fmt_condition)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+BASIC_INFO = 'basic_info'
+ANN_INCOME = 'ann_income'
+QUAR_INCOME = 'quar_income'
+ANN_BALANCE = 'ann_balance'
+QUAR_BALANCE = 'quar_balance'
+ANN_CF = 'ann_cf'
+QUAR_CF = 'quar_cf'
+ANN_RATIO = 'ann_ratio'
+QUAR_RATIO = 'quarratio'
+RATIO_TTM = 'ratio_ttm'
+DIV_CAL = 'div_cal'
+EARNINGS_CAL = 'earnings_cal'
+
+STATEMENT_KEY_LS = [
+    ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL, EARNINGS_CAL,
+]
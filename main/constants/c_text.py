@@ -5,6 +5,7 @@ INPUT_HINT__COND = "Condition Formatting - Please enter in decimal"
 ERR__EMPTY_INPUT = 'Please enter at least one ticker.'
 ERR__WRONG_DELIMITER = 'Please use comma as delimiter.'
 ERR__TICKER_NOT_FOUND = 'The following ticker are not found'
+ERR__STALE_STATEMENT = 'Fetching failed for the following ticker, their metrics use the last stored statements'
 
 LABEL__CN = 'China'
 LABEL__US = 'United States'
@@ -16,6 +17,8 @@ LABEL__THEME_STOCK = 'Theme Stock'
 LABEL__WATCHLIST_STOCK = 'Watchlist Stock'
 
 LABEL__SUBMIT = 'Submit'
+LABEL__FORCE_REFRESH = 'Force refresh (ignore cached data)'
+LABEL__EXPORT_FORMAT = 'Raw data format'
 
 TITLE__FINANCIAL_ANALYSIS = 'Financial Analysis'
 
@@ -77,6 +80,7 @@ COMPANY_NAME = 'Company Name'
 CUR_PRICE = 'Current Price'
 DIV_YIELD_TTM = 'Dividend Yield (TTM)'
 GP_LAST_Q = 'Gross Profit (Last Quarter)'
+GROUP = 'Group'
 IR_LAST_FY = 'Inventory / Revenue (Last FY)'
 LAST_DIV_VAL = 'Last Dividend Value'
 LAST_EX_DIV_DT = 'Last Ex-Dividend Date'
@@ -91,6 +95,7 @@ NEXT_EARN_DATE = 'Next Earnings Date'
 NEXT_EARN_EST_EPS = 'Next Earnings Estimate EPS'
 NEXT_EARN_EST_REV = 'Next Earnings Estimate Revenue'
 PR_TTM = 'Payout Ratio (TTM)'
+REGION = 'Region'
 RR_LAST_FY = 'Receivable / Revenue (Last FY)'
 ROIC = 'ROIC'
 TOT_REV_LAST_Q = 'Total Revenue (Last Quarter)'
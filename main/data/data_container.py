@@ -1,5 +1,4 @@
 import re
-import streamlit as st
 from main.constants import c_text
 
 
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from main.constants import c_text
+from main.constants.c_fin_key import (
+    ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL, EARNINGS_CAL,
+)
+
+# Earnings rows start with upcoming estimates, keep room for them on top of the actuals a column needs
+EARNINGS_UPCOMING_ROW = 10
+
+
+def _earnings(n_actual):
+    return {EARNINGS_CAL: n_actual + EARNINGS_UPCOMING_ROW}
+
+
+class LayoutFetchPlan:
+    # Output column -> statement key -> rows of history it reads.
+    # Basic info columns come from the company profile, which is always fetched.
+    col_requirement_dict = {
+        c_text.COMPANY_NAME: {}, c_text.TICKER: {}, c_text.SECTOR: {}, c_text.CCY: {},
+        c_text.CUR_PRICE: {}, c_text.MKT_CAP: {}, c_text.BETA: {},
+        c_text.MIND_SHARE: {}, c_text.MKT_SHARE: {},
+
+        # (B) Investment Metrics
+        c_text.GM_LAST_Q: {QUAR_RATIO: 1},
+        c_text.GM_TTM: {QUAR_INCOME: 4},
+        c_text.GM_FY1: {ANN_RATIO: 1},
+        c_text.GM_FY3: {ANN_RATIO: 3},
+        c_text.GM_FY5: {ANN_RATIO: 5},
+        c_text.GM_FY10: {ANN_RATIO: 10},
+
+        c_text.EPS_CAGR_TTM: _earnings(8),
+        c_text.EPS_CAGR_3Y_TTM: _earnings(12),
+        c_text.EPS_CAGR_5Y_TTM: _earnings(20),
+        c_text.EPS_CAGR_10Y_TTM: _earnings(40),
+
+        c_text.REV_CAGR_1Y: {ANN_INCOME: 2},
+        c_text.REV_CAGR_3Y: {ANN_INCOME: 3},
+        c_text.REV_CAGR_5Y: {ANN_INCOME: 5},
+        c_text.REV_CAGR_10Y: {ANN_INCOME: 10},
+
+        c_text.ROE_TTM: {QUAR_INCOME: 4, QUAR_BALANCE: 1},
+        c_text.ROE_FY1: {ANN_INCOME: 1, ANN_BALANCE: 1},
+        c_text.ROE_FY3: {ANN_INCOME: 3, ANN_BALANCE: 3},
+        c_text.ROE_FY5: {ANN_INCOME: 5, ANN_BALANCE: 5},
+        c_text.ROE_FY10: {ANN_INCOME: 10, ANN_BALANCE: 10},
+
+        c_text.CAPEX_NI_TTM: {QUAR_CF: 4, QUAR_INCOME: 4},
+        c_text.CAPEX_NI_5Y_AVG: {ANN_CF: 5, ANN_INCOME: 5},
+        c_text.CAPEX_NI_10Y_AVG: {ANN_CF: 10, ANN_INCOME: 10},
+
+        # (C) Investment Risks
+        c_text.NDTE_LAST_Q: {QUAR_BALANCE: 1, ANN_BALANCE: 1},
+        c_text.RR_LAST_FY: {ANN_CF: 1, ANN_INCOME: 1},
+        c_text.IR_LAST_FY: {ANN_CF: 1, ANN_INCOME: 1},
+
+        # (D) Valuation
+        c_text.DIV_YIELD_TTM: {RATIO_TTM: 1},
+        c_text.TRAILING_PE_TTM: {RATIO_TTM: 1},
+        c_text.PEG_R_TTM: {RATIO_TTM: 1},
+        c_text.PEG_R_FY1: {RATIO_TTM: 1, **_earnings(8)},
+        c_text.PEG_R_FY3: {RATIO_TTM: 1, **_earnings(12)},
+
+        # (E) Financial Ratio
+        c_text.TOT_REV_LAST_Q: {QUAR_INCOME: 1},
+        c_text.GP_LAST_Q: {QUAR_INCOME: 1},
+        c_text.CAPEX_LAST_Y: {ANN_CF: 1},
+        c_text.NI_LAST_Q: {QUAR_INCOME: 1},
+        c_text.NI_LAST_Y: {ANN_INCOME: 1},
+        c_text.NI_TTM: {QUAR_INCOME: 4},
+        c_text.EPS_TTM: _earnings(4),
+        c_text.LAST_EX_DIV_DT: {DIV_CAL: 1},
+        c_text.LAST_DIV_VAL: {DIV_CAL: 1},
+        c_text.ROIC: {QUAR_INCOME: 4, ANN_RATIO: 1, QUAR_BALANCE: 1},
+        c_text.PR_TTM: {RATIO_TTM: 1},
+        c_text.NEXT_EARN_DATE: _earnings(0),
+        c_text.NEXT_EARN_EST_EPS: _earnings(0),
+        c_text.NEXT_EARN_EST_REV: _earnings(0),
+        c_text.BEAT_EST: _earnings(1),
+        c_text.BEAT_EST_LAST_UPDATE: _earnings(1),
+    }
+
+    @classmethod
+    def plan(cls, col_ls):
+        """
+        Return the minimal statement key -> row limit to fetch for the given output columns.
+
+        Statements no column reads are left out, `fmp.fetch_financials` then does not request them at all.
+        """
+        limits = defaultdict(int)
+        for col in col_ls:
+            for fin_key, depth in cls.col_requirement_dict[col].items():
+                limits[fin_key] = max(limits[fin_key], depth)
+
+        return dict(limits)
@@ -40,6 +40,13 @@ class LayoutOutputData:
     ]
 
 
+    # Quick valuation screen, the price-based ratios only
+    col_valuation_ls = [
+        c_text.DIV_YIELD_TTM, c_text.TRAILING_PE_TTM, c_text.PEG_R_TTM, c_text.PEG_R_FY1, c_text.PEG_R_FY3,
+    ]
+
+
     col_value_order = col_basic_info + col_value_ls
     col_order = col_basic_info + col_growth_theme_ls
+    col_valuation_order = col_basic_info + col_valuation_ls
     
\ No newline at end of file
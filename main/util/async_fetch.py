@@ -0,0 +1,76 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def get_max_concurrency():
+    return int(os.getenv('FMP_MAX_CONCURRENCY', 32))
+
+
+async def _gather(calls, max_concurrency, on_done):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        async def _run(key, fn):
+            async with semaphore:
+                result = await loop.run_in_executor(executor, fn)
+
+            if on_done is not None:
+                on_done(key, result)
+
+            return key, result
+
+        results = await asyncio.gather(*(_run(key, fn) for key, fn in calls.items()))
+
+    return dict(results)
+
+
+def _run_in_pool(calls, max_concurrency, on_done):
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        future_dict = {executor.submit(fn): key for key, fn in calls.items()}
+        result_dict = {}
+        for future in as_completed(future_dict):
+            key = future_dict[future]
+            result_dict[key] = future.result()
+
+            if on_done is not None:
+                on_done(key, result_dict[key])
+
+    return {key: result_dict[key] for key in calls}
+
+
+def run_concurrently(calls, max_concurrency=None, on_done=None):
+    """
+    Run blocking I/O calls concurrently on a thread pool.
+
+    The calls are not async I/O: each one blocks a worker thread of the pool, and an asyncio semaphore bounds how
+    many are in flight. Every call is scheduled at once, so N tickers x 11 endpoints finish in roughly
+    (N x 11 / max_concurrency) round trips without forking a process per CPU.
+
+    When an event loop is already running in the calling thread (e.g. Jupyter, or async code under Streamlit), a
+    new one cannot be started: the calls then run on the thread pool alone, with the same bound.
+
+    Parameters:
+        calls (dict): Mapping of key -> zero-argument callable.
+        max_concurrency (int, optional): Upper bound of in-flight calls. Default is FMP_MAX_CONCURRENCY or 32.
+        on_done (callable, optional): Called with (key, result) as each call finishes, in the calling thread
+            (the event loop's), so it may update the UI.
+
+    Returns:
+        dict: Mapping of key -> result of the callable, in the order of `calls`.
+    """
+    if len(calls) == 0:
+        return {}
+
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+
+    max_concurrency = max(1, max_concurrency)
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_gather(calls, max_concurrency, on_done))
+
+    return _run_in_pool(calls, max_concurrency, on_done)
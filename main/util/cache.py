@@ -0,0 +1,74 @@
+import os
+import time
+
+from main.constants.c_fin_key import (
+    BASIC_INFO, ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL, EARNINGS_CAL,
+)
+from main.util.sqlite_store import SqliteStore, get_store_dir
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Statement key -> seconds a cached response stays fresh
+TTL_DICT = {
+    BASIC_INFO: 1 * HOUR,
+    ANN_INCOME: 7 * DAY,
+    QUAR_INCOME: 1 * DAY,
+    ANN_BALANCE: 7 * DAY,
+    QUAR_BALANCE: 1 * DAY,
+    ANN_CF: 7 * DAY,
+    QUAR_CF: 1 * DAY,
+    ANN_RATIO: 7 * DAY,
+    QUAR_RATIO: 1 * DAY,
+    RATIO_TTM: 1 * HOUR,
+    DIV_CAL: 1 * DAY,
+    EARNINGS_CAL: 6 * HOUR,
+}
+
+
+def get_ttl(fin_key):
+    """Return the TTL in seconds of a statement key, 0 (not cached) for untagged requests."""
+    return TTL_DICT.get(fin_key, 0)
+
+
+class ResponseCache(SqliteStore):
+    schema = '''
+    CREATE TABLE IF NOT EXISTS response (
+        key TEXT PRIMARY KEY,
+        body BLOB NOT NULL,
+        fetched_at REAL NOT NULL
+    );
+    '''
+
+    def get(self, key, ttl):
+        row = self.connection().execute('SELECT body, fetched_at FROM response WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        body, fetched_at = row
+        if time.time() - fetched_at > ttl:
+            return None
+
+        return body
+
+    def set(self, key, body):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO response (key, body, fetched_at) VALUES (?, ?, ?)',
+            (key, body, time.time()),
+        )
+
+    def clear(self):
+        self.connection().execute('DELETE FROM response')
+
+
+_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(os.getenv('FMP_CACHE_PATH', os.path.join(get_store_dir(), 'fmp_cache.sqlite3')))
+
+    return _cache
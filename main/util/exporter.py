@@ -0,0 +1,106 @@
+from typing import Dict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from main.constants import c_text
+from main.data.data_container import DataContainer
+from main.layout.layout_output_data import LayoutOutputData
+from main.util.writer import DT_COL_LS, REGION_LS
+
+# Export format -> file extension, MIME type
+EXPORT_FORMAT_DICT = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+    'csv': ('csv', 'text/csv'),
+    'jsonl': ('jsonl', 'application/jsonl'),
+}
+
+# Text columns of the layout, every other layout column is a number
+TEXT_COL_LS = [c_text.COMPANY_NAME, c_text.TICKER, c_text.SECTOR, c_text.CCY] + DT_COL_LS
+
+
+def _to_text(val):
+    """Cell of a text column: null when missing (None or NaN), otherwise a str."""
+    if val is None or (isinstance(val, float) and val != val):
+        return None
+
+    return val if isinstance(val, str) else str(val)
+
+
+class Exporter:
+    @classmethod
+    def to_table(cls, raw_data_df: pd.DataFrame, data_layout_dict: Dict[str, DataContainer]) -> pd.DataFrame:
+        """
+        Raw output table for machine readers: one row per sheet, region and ticker, in the order of the workbook.
+
+        The column types come from the layout, not from the values of the run, so the schema is the same from one
+        run to the next: numeric columns are float64, unformatted, even when every value is missing. Missing values
+        of text columns (None or NaN) are null, any other non-text value is cast to str.
+
+        Parameters:
+        - raw_data_df: Raw output table, one row per ticker
+        - data_layout_dict: Tickers of each sheet by region
+
+        Returns:
+            pd.DataFrame: The group (sheet) and region columns, then the columns of `raw_data_df`.
+        """
+        # Position of the first row of each ticker
+        pos_dict = {}
+        for pos, ticker in enumerate(raw_data_df[c_text.TICKER]):
+            pos_dict.setdefault(ticker, pos)
+
+        group_ls, region_ls, pos_ls = [], [], []
+        for sheetname, data_container in data_layout_dict.items():
+            for _, region_label, attr in REGION_LS:
+                ticker_ls = getattr(data_container, attr)
+                group_ls += [sheetname] * len(ticker_ls)
+                region_ls += [region_label] * len(ticker_ls)
+                pos_ls += [pos_dict[ticker] for ticker in ticker_ls]
+
+        table_df = raw_data_df.iloc[pos_ls].reset_index(drop=True)
+        for col in table_df.columns:
+            if col in LayoutOutputData.col_order and col not in TEXT_COL_LS:
+                table_df[col] = pd.to_numeric(table_df[col], errors='coerce').astype('float64')
+            elif col in TEXT_COL_LS or table_df[col].dtype == object:
+                # The string dtype keeps a column of missing values typed, an object column of None has no type
+                table_df[col] = pd.array([_to_text(val) for val in table_df[col]], dtype='string')
+
+        table_df.insert(0, c_text.REGION, region_ls)
+        table_df.insert(0, c_text.GROUP, group_ls)
+
+        return table_df
+
+    @classmethod
+    def write(cls, table_df: pd.DataFrame, output, fmt):
+        """
+        Write the table in an export format.
+
+        Parameters:
+        - table_df: Table from `to_table`
+        - output: Path of the file, or a writable binary stream
+        - fmt: One of EXPORT_FORMAT_DICT
+        """
+        if fmt == 'jsonl':
+            # NaN is written as null
+            content = table_df.to_json(orient='records', lines=True, force_ascii=False)
+            if isinstance(output, str):
+                with open(output, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            else:
+                output.write(content.encode('utf-8'))
+            return
+
+        table = pa.Table.from_pandas(table_df, preserve_index=False)
+
+        if fmt == 'parquet':
+            pq.write_table(table, output)
+        elif fmt == 'arrow':
+            with pa.ipc.new_file(output, table.schema) as ipc_writer:
+                ipc_writer.write_table(table)
+        elif fmt == 'csv':
+            pa_csv.write_csv(table, output)
+        else:
+            raise ValueError(f'Unknown export format: {fmt}')
@@ -1,41 +1,241 @@
+import csv
+import io
+import os
+import threading
+import time
+from functools import partial
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
+
+from main.util.cache import get_response_cache, get_ttl
+from main.util.ingest import loads, project_payload
+from main.util.fixture import MODE_RECORD, MODE_REPLAY, get_fetch_mode, get_fixture_store, get_latency_model
+from main.util.rate_limiter import get_rate_limiter
+from main.util.single_flight import SingleFlight
+
+# 429 is not retried by the session, it pauses the shared rate limiter instead, see `_download`
+RETRY_STATUS_LS = [500, 502, 503, 504]
+SECRET_PARAM_LS = ['apikey']
+
+_local = threading.local()
+_single_flight = SingleFlight()
+
+
+def _build_session():
+    """
+    Build a pooled keep-alive session with retry-with-backoff on 5xx.
+
+    The retry and pool settings are read from the environment so they can be tuned without code changes:
+        FMP_RETRY_TOTAL (default 3), FMP_RETRY_BACKOFF (default 0.5 seconds), FMP_POOL_SIZE (default 16).
+    """
+    retry = Retry(
+        total=int(os.getenv('FMP_RETRY_TOTAL', 3)),
+        backoff_factor=float(os.getenv('FMP_RETRY_BACKOFF', 0.5)),
+        status_forcelist=RETRY_STATUS_LS,
+        allowed_methods=['GET'],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    pool_size = int(os.getenv('FMP_POOL_SIZE', 16))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # gzip / deflate, plus br when brotli is installed
+    session.headers.update(make_headers(accept_encoding=True, keep_alive=True))
+
+    return session
+
+
+def get_session():
+    """
+    Return the session of the current worker.
+
+    One session is kept per thread and per process, so joblib workers and Streamlit script threads
+    each reuse their own connection pool instead of paying a new TCP + TLS handshake per call.
+    """
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.session = _build_session()
+        _local.pid = pid
+
+    return _local.session
+
+
+def reset_session():
+    """Close the session of the current worker, the next call will build a new one."""
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        session.close()
+
+    _local.session = None
+    _local.pid = None
+
+
+def request_key(url, params=None):
+    """
+    Return a stable key of a request: the URL with sorted query parameters and the API key stripped.
+
+    e.g. https://host/stable/ratios?apikey=X&symbol=AAPL&period=annual&limit=10
+        -> https://host/stable/ratios?limit=10&period=annual&symbol=AAPL
+    """
+    split = urlsplit(url)
+    query = parse_qsl(split.query) + list((params or {}).items())
+    query = sorted((k, str(v)) for k, v in query if k.lower() not in SECRET_PARAM_LS)
+
+    return f'{split.scheme}://{split.netloc}{split.path}?{urlencode(query)}'
+
+
+def _is_cacheable(payload):
+    # FMP answers quota and key errors with HTTP 200 and an error message
+    return not (isinstance(payload, dict) and 'Error Message' in payload)
+
+
+def _get_retry_after(response, default=60.0):
+    try:
+        return float(response.headers.get('Retry-After', default))
+    except ValueError:
+        return default
+
+
+def _download(url, params=None, headers=None, timeout=10):
+    """
+    Download the raw body of a request, waiting for a slot of the shared FMP rate limiter first.
+
+    On 429 the whole host backs off for the Retry-After period and the call waits for its next slot,
+    up to FMP_MAX_THROTTLE_RETRY (default 5) times.
+    """
+    limiter = get_rate_limiter()
+    max_throttle_retry = int(os.getenv('FMP_MAX_THROTTLE_RETRY', 5))
+
+    for attempt in range(max_throttle_retry + 1):
+        limiter.acquire()
+
+        try:
+            response = get_session().get(url, params=params, headers=headers, timeout=timeout)
+
+            if response.status_code == 429 and attempt < max_throttle_retry:
+                limiter.pause(_get_retry_after(response))
+                continue
+
+            response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
+
+            return response.content
+
+        except requests.exceptions.Timeout:
+            print(f"Request timed out after {timeout} seconds.")
+            return None
 
-def fetch_data(url, params=None, headers=None, timeout=10):
+        except requests.exceptions.HTTPError as http_err:
+            print(f"HTTP error occurred: {http_err}")
+            return None
+
+        except requests.exceptions.RequestException as req_err:
+            print(f"An error occurred: {req_err}")
+            return None
+
+
+def _to_number(val):
+    if val == '':
+        return None
+
+    try:
+        return float(val)
+    except ValueError:
+        return val
+
+
+def _parse_csv(body):
+    reader = csv.DictReader(io.StringIO(body.decode('utf-8-sig')))
+    return [{k: _to_number(v) for k, v in row.items()} for row in reader]
+
+
+def _parse(body, fmt, project=False):
+    try:
+        # Attempt to parse JSON response
+        payload = _parse_csv(body) if fmt == 'csv' else loads(body)
+
+    except ValueError:
+        print(f"Failed to parse {fmt.upper()} response.")
+        return None
+
+    return project_payload(payload) if project else payload
+
+
+def _download_and_store(key, ttl, url, params, headers, timeout, fmt, project):
+    body = _download(url, params=params, headers=headers, timeout=timeout)
+    if body is None:
+        return None
+
+    if get_fetch_mode() == MODE_RECORD:
+        get_fixture_store().put(key, body)
+
+    payload = _parse(body, fmt, project)
+    if payload is not None and ttl > 0 and _is_cacheable(payload):
+        get_response_cache().set(key, body)
+
+    return payload
+
+
+def _replay(key, fmt, project):
+    body = get_fixture_store().get(key)
+
+    latency = get_latency_model()
+    if latency is not None:
+        time.sleep(latency.sample(key))
+
+    if body is None:
+        print(f"No recorded response for {key}.")
+        return None
+
+    return _parse(body, fmt, project)
+
+
+def fetch_data(url, params=None, headers=None, timeout=10, fin_key=None, refresh=False, fmt='json', project=False):
     """
     Fetch data from an API URL.
 
+    Responses of tagged requests are kept in the local response cache for the TTL of their statement key,
+    see `main.util.cache.TTL_DICT`. Concurrent requests for the same URL share one in-flight download and
+    receive the same parsed object, which must be treated as read-only.
+
+    In replay mode (see `main.util.fixture.set_fetch_mode`) responses are served from the fixture store only,
+    without cache, rate limiter or network access. In record mode every response served is also stored there.
+
     Parameters:
         url (str): The API endpoint URL.
         params (dict, optional): Query parameters to include in the request.
         headers (dict, optional): Headers to include in the request.
         timeout (int, optional): Timeout for the request in seconds. Default is 10 seconds.
+        fin_key (str, optional): Statement key of the request, selects the cache TTL. Default is not cached.
+        refresh (bool, optional): Skip the cached response and download it again. Default is False.
+        fmt (str, optional): 'json', or 'csv' for the bulk endpoints. Default is 'json'.
+        project (bool, optional): Keep only the fields referenced in `c_api_text`, packed as `ingest.Record`s.
+            Default is False.
 
     Returns:
-        dict or list: Parsed JSON response if successful.
+        dict or list: Parsed JSON (or list of CSV rows) response if successful.
         None: If an error occurs.
-
-    Raises:
-        requests.exceptions.RequestException: For non-recoverable errors.
     """
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=timeout)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
-        
-        # Attempt to parse JSON response
-        return response.json()
+    key = request_key(url, params)
+    ttl = get_ttl(fin_key)
 
-    except requests.exceptions.Timeout:
-        print(f"Request timed out after {timeout} seconds.")
-        return None
-    
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-        return None
-    
-    except requests.exceptions.RequestException as req_err:
-        print(f"An error occurred: {req_err}")
-        return None
-    
-    except ValueError:
-        print("Failed to parse JSON response.")
-        return None
+    if get_fetch_mode() == MODE_REPLAY:
+        return _replay(key, fmt, project)
+
+    if ttl > 0 and not refresh:
+        body = get_response_cache().get(key, ttl)
+        if body is not None:
+            if get_fetch_mode() == MODE_RECORD:
+                get_fixture_store().put(key, body)
+
+            return _parse(body, fmt, project)
+
+    return _single_flight.do(
+        (key, project), partial(_download_and_store, key, ttl, url, params, headers, timeout, fmt, project),
+    )
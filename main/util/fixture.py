@@ -0,0 +1,116 @@
+import os
+import random
+import zlib
+
+from main.util.sqlite_store import SqliteStore, get_store_dir
+
+MODE_LIVE = 'live'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+
+class FixtureStore(SqliteStore):
+    """Recorded FMP responses keyed by the API-key-stripped request URL, bodies are zlib compressed."""
+    schema = '''
+    CREATE TABLE IF NOT EXISTS fixture (
+        key TEXT PRIMARY KEY,
+        body BLOB NOT NULL
+    );
+    '''
+
+    def get(self, key):
+        row = self.connection().execute('SELECT body FROM fixture WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        return zlib.decompress(row[0])
+
+    def put(self, key, body):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO fixture (key, body) VALUES (?, ?)', (key, zlib.compress(body, 6)),
+        )
+
+    def keys(self):
+        return [row[0] for row in self.connection().execute('SELECT key FROM fixture ORDER BY key')]
+
+
+class LatencyModel:
+    """
+    Injected replay latency, parsed from a spec:
+        '0.05'                   fixed 50ms
+        'uniform:0.02,0.2'       uniform between 20ms and 200ms
+        'lognormal:-2.5,0.6'     lognormal with mu, sigma of the underlying normal
+
+    The latency of a request only depends on its key and the seed, so a slow run replays exactly.
+    """
+
+    def __init__(self, spec, seed=0):
+        self.spec = spec
+        self.seed = seed
+
+        name, _, args = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+        self.name = name
+        self.args = [float(a) for a in args.split(',')]
+
+        if self.name not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f'Unknown latency distribution: {spec}')
+
+    def sample(self, key):
+        rng = random.Random(zlib.crc32(key.encode()) ^ self.seed)
+
+        if self.name == 'uniform':
+            return rng.uniform(*self.args)
+
+        if self.name == 'lognormal':
+            return rng.lognormvariate(*self.args)
+
+        return self.args[0]
+
+
+_mode = None
+_store = None
+_latency = None
+
+
+def set_fetch_mode(mode, fixture_path=None, latency=None, seed=0):
+    """
+    Switch the fetch layer between live, record and replay.
+
+    Parameters:
+        mode (str): 'live', 'record' (fetch live and store every response) or 'replay' (serve stored responses only).
+        fixture_path (str, optional): Fixture store file. Default is FMP_FIXTURE_PATH or .cache/fmp_fixtures.sqlite3.
+        latency (str, optional): Replay latency spec, see `LatencyModel`. Default is no latency.
+        seed (int, optional): Seed of the latency model. Default is 0.
+    """
+    global _mode, _store, _latency
+    if mode not in (MODE_LIVE, MODE_RECORD, MODE_REPLAY):
+        raise ValueError(f'Unknown fetch mode: {mode}')
+
+    if fixture_path is None:
+        fixture_path = os.getenv('FMP_FIXTURE_PATH', os.path.join(get_store_dir(), 'fmp_fixtures.sqlite3'))
+
+    _mode = mode
+    _store = FixtureStore(fixture_path) if mode != MODE_LIVE else None
+    _latency = LatencyModel(latency, seed) if latency else None
+
+
+def get_fetch_mode():
+    """Return the active mode, initialised from FMP_FETCH_MODE, FMP_REPLAY_LATENCY and FMP_REPLAY_SEED."""
+    if _mode is None:
+        set_fetch_mode(
+            os.getenv('FMP_FETCH_MODE', MODE_LIVE),
+            latency=os.getenv('FMP_REPLAY_LATENCY'),
+            seed=int(os.getenv('FMP_REPLAY_SEED', 0)),
+        )
+
+    return _mode
+
+
+def get_fixture_store() -> FixtureStore:
+    get_fetch_mode()
+    return _store
+
+
+def get_latency_model() -> LatencyModel:
+    get_fetch_mode()
+    return _latency
@@ -0,0 +1,235 @@
+import os
+from collections import defaultdict
+from functools import partial
+
+from main.constants import c_api_text
+from main.constants.c_fin_key import (
+    BASIC_INFO, ANN_BALANCE, ANN_CF, ANN_INCOME, ANN_RATIO, DIV_CAL, EARNINGS_CAL,
+    QUAR_BALANCE, QUAR_CF, QUAR_INCOME, QUAR_RATIO, RATIO_TTM, STATEMENT_KEY_LS,
+)
+from main.util.async_fetch import run_concurrently
+from main.util.fetch import fetch_data
+from main.util.fixture import MODE_REPLAY, get_fetch_mode
+from main.util.history import get_statement_history, merge_rows
+
+BASE_URL = 'https://financialmodelingprep.com/stable'
+PROFILE_URL = 'https://financialmodelingprep.com/api/v3/profile'
+
+# Batched mode: symbols per multi-symbol request, max URL length, and the universe size from which
+# the whole-market bulk file is cheaper than one request per symbol
+MAX_SYMBOL_PER_CHUNK = 50
+MAX_URL_LEN = 2_000
+BULK_THRESHOLD = 50
+
+# Statement key -> (endpoint, period)
+STATEMENT_ENDPOINTS = {
+    ANN_INCOME: ('income-statement', 'annual'),
+    QUAR_INCOME: ('income-statement', 'quarterly'),
+    ANN_BALANCE: ('balance-sheet-statement', 'annual'),
+    QUAR_BALANCE: ('balance-sheet-statement', 'quarterly'),
+    ANN_CF: ('cash-flow-statement', 'annual'),
+    QUAR_CF: ('cash-flow-statement', 'quarterly'),
+    ANN_RATIO: ('ratios', 'annual'),
+    QUAR_RATIO: ('ratios', 'quarterly'),
+    RATIO_TTM: ('ratios-ttm', None),
+    DIV_CAL: ('dividends', None),
+    EARNINGS_CAL: ('earnings', None),
+}
+
+# Incremental mode: rows fetched on a routine refresh, statements without history (TTM ratios) are always fetched
+INCREMENTAL_LIMITS = {
+    ANN_INCOME: 2, QUAR_INCOME: 2, ANN_BALANCE: 2, QUAR_BALANCE: 2, ANN_CF: 2, QUAR_CF: 2,
+    ANN_RATIO: 2, QUAR_RATIO: 2, DIV_CAL: 4, EARNINGS_CAL: 8,
+}
+
+# Earnings rows include upcoming estimates, so ask for 40 more rows to cover 10Y of actuals
+EARNINGS_EXTRA_LIMIT = 40
+
+
+def default_limits(limit=10):
+    limits = {fin_key: limit for fin_key in STATEMENT_KEY_LS}
+    limits[EARNINGS_CAL] = limit + EARNINGS_EXTRA_LIMIT
+
+    return limits
+
+
+def build_statement_url(ticker, fin_key, limit):
+    endpoint, period = STATEMENT_ENDPOINTS[fin_key]
+    url = f"{BASE_URL}/{endpoint}?symbol={ticker}"
+    if period is not None:
+        url += f"&period={period}"
+
+    return f"{url}&limit={limit}&apikey={os.getenv('FMP_KEY')}"
+
+
+def build_profile_url(ticker_ls):
+    return f"{PROFILE_URL}/{','.join(ticker_ls)}?apikey={os.getenv('FMP_KEY')}"
+
+
+def chunk_symbols(ticker_ls, max_symbol=MAX_SYMBOL_PER_CHUNK, max_url_len=MAX_URL_LEN):
+    """Split symbols into chunks whose multi-symbol URL stays within `max_symbol` symbols and `max_url_len` chars."""
+    chunk_ls = []
+    chunk = []
+    url_len = len(build_profile_url([]))
+
+    for ticker in ticker_ls:
+        ticker_len = len(ticker) + 1
+        if len(chunk) > 0 and (len(chunk) >= max_symbol or url_len + ticker_len > max_url_len):
+            chunk_ls.append(chunk)
+            chunk = []
+            url_len = len(build_profile_url([]))
+
+        chunk.append(ticker)
+        url_len += ticker_len
+
+    if len(chunk) > 0:
+        chunk_ls.append(chunk)
+
+    return chunk_ls
+
+
+def fetch_profiles(ticker_ls, refresh=False, max_concurrency=None):
+    """
+    Fetch company profiles of many tickers with comma separated multi-symbol requests.
+
+    Returns:
+        dict: ticker -> profile record, tickers unknown to FMP are left out.
+    """
+    calls = {
+        i: partial(fetch_data, build_profile_url(chunk), fin_key=BASIC_INFO, refresh=refresh, project=True)
+        for i, chunk in enumerate(chunk_symbols(list(dict.fromkeys(ticker_ls))))
+    }
+
+    result = {}
+    for res in run_concurrently(calls, max_concurrency).values():
+        for record in res or []:
+            result[record.get(c_api_text.FMP_SYMBOL)] = record
+
+    return result
+
+
+def fetch_ratios_ttm_bulk(ticker_ls, refresh=False):
+    """
+    Fetch TTM ratios of the whole market with one bulk request and pick the tickers out of it.
+
+    Returns:
+        dict: ticker -> [ratio record] shaped like the per-symbol response, None if the bulk file is unavailable.
+    """
+    url = f"{BASE_URL}/ratios-ttm-bulk?apikey={os.getenv('FMP_KEY')}"
+    res = fetch_data(url, fin_key=RATIO_TTM, refresh=refresh, fmt='csv', timeout=60, project=True)
+    if not isinstance(res, list) or len(res) == 0:
+        return None
+
+    record_dict = {record.get(c_api_text.FMP_SYMBOL): record for record in res}
+
+    return {ticker: [record_dict[ticker]] if ticker in record_dict else [] for ticker in ticker_ls}
+
+
+def fetch_statement(ticker, fin_key, limit, refresh=False):
+    return fetch_data(build_statement_url(ticker, fin_key, limit), fin_key=fin_key, refresh=refresh, project=True)
+
+
+def fetch_statement_incremental(ticker, fin_key, limit, refresh=False):
+    """
+    Fetch only the newest rows of a statement and merge them into its stored history.
+
+    Falls back to a full fetch of `limit` rows when there is no history deep enough, on a forced refresh,
+    or when `merge_rows` detects a restatement or missed periods.
+    """
+    history = get_statement_history()
+    known = None if refresh else history.get(ticker, fin_key)
+
+    if known is not None and known[1] >= limit:
+        recent_rows = fetch_statement(ticker, fin_key, INCREMENTAL_LIMITS[fin_key])
+        if not isinstance(recent_rows, list):
+            return known[0][:limit]
+
+        # The stored history keeps the requested depth, it does not grow by the new rows of every run
+        merged_rows, is_full_fetch_needed = merge_rows(fin_key, known[0], recent_rows, limit)
+        if not is_full_fetch_needed:
+            history.set(ticker, fin_key, merged_rows, limit)
+            return merged_rows
+
+        refresh = True
+
+    rows = fetch_statement(ticker, fin_key, limit, refresh)
+    if isinstance(rows, list):
+        history.set(ticker, fin_key, rows, limit)
+
+    return rows
+
+
+def fetch_financials(ticker_ls, limits=None, max_concurrency=None, refresh=False, batch=False, incremental=False,
+                     on_progress=None, on_ticker=None):
+    """
+    Fetch every (ticker, statement) pair concurrently.
+
+    Parameters:
+        ticker_ls (list): Tickers to fetch, duplicates are fetched once.
+        limits (dict, optional): Statement key -> number of rows. Default is `default_limits()`.
+        max_concurrency (int, optional): Upper bound of in-flight requests.
+        refresh (bool, optional): Bypass the response cache. Default is False.
+        batch (bool, optional): Use the bulk TTM ratio file for universes of `BULK_THRESHOLD` tickers or more.
+        incremental (bool, optional): Fetch only the newest rows of statements with a stored history.
+        on_progress (callable, optional): Called with (n_done, n_total) requests as each request finishes.
+        on_ticker (callable, optional): Called with (ticker, statement key -> parsed JSON) as soon as every
+            statement of a ticker is in, tickers finish roughly in `ticker_ls` order.
+
+    Returns:
+        defaultdict: ticker -> statement key -> parsed JSON, the `data_raw_financials` structure.
+    """
+    if limits is None:
+        limits = default_limits()
+
+    unique_ticker_ls = list(dict.fromkeys(ticker_ls))
+    result = defaultdict(dict)
+
+    # Replays must not depend on the local statement history
+    if get_fetch_mode() == MODE_REPLAY:
+        incremental = False
+
+    if batch and RATIO_TTM in limits and len(unique_ticker_ls) >= BULK_THRESHOLD:
+        bulk_res = fetch_ratios_ttm_bulk(unique_ticker_ls, refresh=refresh)
+
+        # Fall back to one request per symbol when the plan has no bulk access
+        if bulk_res is not None:
+            limits = {k: v for k, v in limits.items() if k != RATIO_TTM}
+            for ticker, res in bulk_res.items():
+                result[ticker][RATIO_TTM] = res
+
+    def _get_call(ticker, fin_key, limit):
+        if incremental and fin_key in INCREMENTAL_LIMITS:
+            return partial(fetch_statement_incremental, ticker, fin_key, limit, refresh)
+
+        return partial(fetch_statement, ticker, fin_key, limit, refresh)
+
+    calls = {
+        (ticker, fin_key): _get_call(ticker, fin_key, limit)
+        for ticker in unique_ticker_ls
+        for fin_key, limit in limits.items()
+    }
+
+    n_pending_dict = {ticker: len(limits) for ticker in unique_ticker_ls}
+    n_done = 0
+
+    def _on_done(key, res):
+        nonlocal n_done
+        ticker, fin_key = key
+        result[ticker][fin_key] = res
+
+        n_done += 1
+        if on_progress is not None:
+            on_progress(n_done, len(calls))
+
+        n_pending_dict[ticker] -= 1
+        if n_pending_dict[ticker] == 0 and on_ticker is not None:
+            on_ticker(ticker, result[ticker])
+
+    # Tickers with nothing left to request are complete right away
+    if len(limits) == 0 and on_ticker is not None:
+        for ticker in unique_ticker_ls:
+            on_ticker(ticker, result[ticker])
+
+    run_concurrently(calls, max_concurrency, on_done=_on_done)
+
+    return result
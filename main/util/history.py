@@ -0,0 +1,108 @@
+import json
+import os
+import time
+
+from main.constants import c_api_text
+from main.constants.c_fin_key import EARNINGS_CAL
+from main.util.ingest import project_rows, to_plain
+from main.util.sqlite_store import SqliteStore, get_store_dir
+
+# Rows whose settled field is still empty (e.g. upcoming earnings) may change freely without being a restatement
+SETTLED_FIELD_DICT = {
+    EARNINGS_CAL: c_api_text.FMP_EPS_ACT,
+}
+
+
+class StatementHistory(SqliteStore):
+    """
+    Known rows of each (ticker, statement key), newest first.
+
+    `depth` is the row limit of the last full fetch, so a layout asking for a deeper history triggers a full fetch.
+    """
+    schema = '''
+    CREATE TABLE IF NOT EXISTS history (
+        ticker TEXT NOT NULL,
+        fin_key TEXT NOT NULL,
+        rows TEXT NOT NULL,
+        depth INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (ticker, fin_key)
+    );
+    '''
+
+    def get(self, ticker, fin_key):
+        """Return (rows, depth) or None when the statement was never fetched."""
+        row = self.connection().execute(
+            'SELECT rows, depth FROM history WHERE ticker = ? AND fin_key = ?', (ticker, fin_key),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return project_rows(json.loads(row[0])), row[1]
+
+    def set(self, ticker, fin_key, rows, depth):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO history (ticker, fin_key, rows, depth, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (ticker, fin_key, json.dumps(to_plain(rows)), depth, time.time()),
+        )
+
+
+def _is_settled(fin_key, row):
+    settled_field = SETTLED_FIELD_DICT.get(fin_key)
+    return settled_field is None or row.get(settled_field) is not None
+
+
+def merge_rows(fin_key, history_rows, recent_rows, limit=None):
+    """
+    Merge the newest rows into the known history by date.
+
+    Parameters:
+        fin_key (str): Statement key of the rows.
+        history_rows (list): Known rows, newest first.
+        recent_rows (list): Newest rows just fetched.
+        limit (int, optional): Keep at most this many merged rows, the newest. Default keeps them all.
+
+    Returns:
+        tuple: (merged rows newest first, is_full_fetch_needed). A full fetch is needed when a settled row changed
+            (restatement) or when the recent rows do not reach back to the history (missed periods).
+    """
+    if len(recent_rows) == 0:
+        return history_rows[:limit], False
+
+    history_dict = {row.get(c_api_text.FMP_DT): row for row in history_rows}
+
+    for row in recent_rows:
+        old_row = history_dict.get(row.get(c_api_text.FMP_DT))
+        if old_row is None or not _is_settled(fin_key, old_row):
+            continue
+
+        for k, v in old_row.items():
+            if v is not None and k in row and row.get(k) != v:
+                return history_rows, True
+
+    oldest_dt = min(row.get(c_api_text.FMP_DT) or '' for row in recent_rows)
+    if len(history_rows) > 0 and oldest_dt not in history_dict:
+        return history_rows, True
+
+    # Unsettled rows inside the recent window are superseded by it, e.g. a rescheduled earnings date
+    merged_dict = {
+        dt: row for dt, row in history_dict.items()
+        if _is_settled(fin_key, row) or (dt or '') < oldest_dt
+    }
+    merged_dict.update({row.get(c_api_text.FMP_DT): row for row in recent_rows})
+    merged_rows = sorted(merged_dict.values(), key=lambda row: row.get(c_api_text.FMP_DT) or '', reverse=True)
+
+    return merged_rows[:limit], False
+
+
+_history = None
+
+
+def get_statement_history() -> StatementHistory:
+    global _history
+    if _history is None:
+        _history = StatementHistory(
+            os.getenv('FMP_HISTORY_PATH', os.path.join(get_store_dir(), 'fmp_history.sqlite3')),
+        )
+
+    return _history
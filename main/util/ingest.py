@@ -0,0 +1,138 @@
+import json
+from array import array
+
+from main.constants import c_api_text
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Every FMP field the metric code reads, the rest of each row is dropped at ingest
+PROJECTED_FIELD_SET = frozenset(v for k, v in vars(c_api_text).items() if k.startswith('FMP_'))
+
+_NAN = float('nan')
+
+# Field layouts are interned, so every response with the same fields shares one layout object
+_layout_dict = {}
+
+
+def loads(body):
+    """Decode a JSON body with orjson when installed, the standard library otherwise."""
+    if orjson is not None:
+        return orjson.loads(body)
+
+    return json.loads(body)
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+class Record:
+    """
+    Compact read-only row of a projected FMP response.
+
+    Numeric fields are packed in a float64 array (None as NaN) and text fields in a tuple. The field layout
+    is shared by every row of the response, so a row costs a few bytes per field instead of a full dict.
+    Supports the dict read API used by the metric code: `get`, `[]`, `in`, `keys` and `items`.
+
+    Unlike a dict, a null value reads as missing: `get` returns its `default` for a field that is None or NaN in
+    this row, the same as for a field the response does not have. `in` and `[]` still see the field.
+    """
+    __slots__ = ('_layout', '_num', '_txt')
+
+    def __init__(self, layout, num, txt):
+        self._layout = layout
+        self._num = num
+        self._txt = txt
+
+    def get(self, key, default=None):
+        loc = self._layout.get(key)
+        if loc is None:
+            return default
+
+        # A null value reads as missing, see the class docstring
+        is_num, pos = loc
+        if is_num:
+            val = self._num[pos]
+            return default if val != val else val
+
+        val = self._txt[pos]
+        return default if val is None else val
+
+    def __getitem__(self, key):
+        if key not in self._layout:
+            raise KeyError(key)
+
+        return self.get(key)
+
+    def __contains__(self, key):
+        return key in self._layout
+
+    def __len__(self):
+        return len(self._layout)
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def keys(self):
+        return self._layout.keys()
+
+    def items(self):
+        return [(k, self.get(k)) for k in self._layout]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+
+        return NotImplemented
+
+    def __repr__(self):
+        return f'Record({self.to_dict()})'
+
+
+def project_rows(rows, field_set=PROJECTED_FIELD_SET):
+    """Project a list of dict rows onto `field_set` and pack them into `Record`s sharing one layout."""
+    field_ls = list(dict.fromkeys(k for row in rows for k in row.keys() if k in field_set))
+    is_num_ls = [
+        all(row.get(f) is None or _is_number(row.get(f)) for row in rows)
+        for f in field_ls
+    ]
+
+    layout = {}
+    num_field_ls = []
+    txt_field_ls = []
+    for f, is_num in zip(field_ls, is_num_ls):
+        if is_num:
+            layout[f] = (True, len(num_field_ls))
+            num_field_ls.append(f)
+        else:
+            layout[f] = (False, len(txt_field_ls))
+            txt_field_ls.append(f)
+
+    layout = _layout_dict.setdefault(tuple(layout.items()), layout)
+
+    record_ls = []
+    for row in rows:
+        num = array('d', [_NAN if row.get(f) is None else float(row.get(f)) for f in num_field_ls])
+        txt = tuple(row.get(f) for f in txt_field_ls)
+        record_ls.append(Record(layout, num, txt))
+
+    return record_ls
+
+
+def project_payload(payload):
+    """Project a list response into `Record`s, other payloads (error messages, None) are returned as is."""
+    if isinstance(payload, list) and all(isinstance(row, (dict, Record)) for row in payload):
+        return project_rows(payload)
+
+    return payload
+
+
+def to_plain(rows):
+    """Convert `Record`s back to dicts, e.g. to serialise them."""
+    return [row.to_dict() if isinstance(row, Record) else row for row in rows]
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from main.util.ingest import Record
+
+# Rough per-object overheads used by `estimate_size`, in bytes
+OBJ_OVERHEAD = 64
+FIELD_SIZE = 16
+
+
+def estimate_size(value):
+    """Approximate memory footprint of a parsed result (rows, dicts, scalars), cheap enough to run on every set."""
+    if isinstance(value, Record):
+        return OBJ_OVERHEAD + 8 * len(value._num) + FIELD_SIZE * len(value._txt)
+
+    if isinstance(value, (list, tuple)):
+        return OBJ_OVERHEAD + sum(estimate_size(v) for v in value)
+
+    if isinstance(value, dict):
+        return OBJ_OVERHEAD + sum(FIELD_SIZE + estimate_size(v) for v in value.values())
+
+    if isinstance(value, str):
+        return OBJ_OVERHEAD + len(value)
+
+    return FIELD_SIZE
+
+
+class MemoryCache:
+    """
+    In-memory cache of parsed results shared by every thread of the process, e.g. every Streamlit session.
+
+    Each entry expires after its own TTL and the least recently used entries are evicted once the estimated
+    size of the cache exceeds `max_bytes`. Values are shared, callers must not mutate them.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._lock = threading.Lock()
+        self._entry_dict = OrderedDict()  # key -> (value, expires_at, n_bytes)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entry_dict.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at, n_bytes = entry
+            if time.time() > expires_at:
+                del self._entry_dict[key]
+                self.n_bytes -= n_bytes
+                return default
+
+            self._entry_dict.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+
+        n_bytes = estimate_size(value)
+        if n_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old_entry = self._entry_dict.pop(key, None)
+            if old_entry is not None:
+                self.n_bytes -= old_entry[2]
+
+            self._entry_dict[key] = (value, time.time() + ttl, n_bytes)
+            self.n_bytes += n_bytes
+
+            while self.n_bytes > self.max_bytes:
+                _, (_, _, evicted_n_bytes) = self._entry_dict.popitem(last=False)
+                self.n_bytes -= evicted_n_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entry_dict.clear()
+            self.n_bytes = 0
+
+    def __len__(self):
+        return len(self._entry_dict)
+
+
+def get_memory_cache_max_bytes():
+    return int(float(os.getenv('MEMORY_CACHE_MAX_MB', 512)) * 1024 * 1024)
@@ -0,0 +1,266 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from main.constants import c_api_text, c_text
+from main.constants.c_fin_key import (
+    ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL,
+)
+from main.util.metrics_engine import calc_cagr, safe_div
+
+
+# Inputs read from the engine, a tuple of (MetricsEngine method, *args) so equal reads are shared
+def _value(fin_key, field, idx=0, default_value=0.0, is_num=True):
+    return ('value', fin_key, field, idx, default_value, is_num)
+
+
+def _window(fin_key, field, n):
+    return ('window_sum', fin_key, field, n)
+
+
+def _eps_window(beg_n, end_n):
+    return ('earnings_window_sum', c_api_text.FMP_EPS_ACT, beg_n, end_n)
+
+
+def _earnings(field, is_est=True, default_value=0.0, is_num=True):
+    return ('earnings_first', field, is_est, default_value, is_num)
+
+
+_EMPTY = ('empty',)
+
+def _same(val):
+    return val
+
+
+def _beat_estimate(act_eps, est_eps):
+    return safe_div(act_eps, est_eps) - 1.0
+
+
+def _roic(ebit_ttm, tax_rate, total_debt, total_equity, cash_equiv):
+    return safe_div(ebit_ttm * (1 - tax_rate), total_debt + total_equity - cash_equiv)
+
+
+def _cagr(period):
+    return partial(calc_cagr, period=period)
+
+
+# Intermediate metrics shared by several columns
+_GP_TTM = 'gp_ttm'
+_REV_TTM = 'rev_ttm'
+_CAPEX_TTM = 'capex_ttm'
+_EBIT_TTM = 'ebit_ttm'
+_EPS_2Y = 'eps_prev_2y'
+_EPS_3Y = 'eps_prev_3y'
+_EPS_5Y = 'eps_prev_5y'
+_EPS_10Y = 'eps_prev_10y'
+_REV_FY1 = 'rev_prev_1y'
+
+
+def _closure(name_ls):
+    # Metrics and engine reads the names depend on, inputs before the metrics reading them
+    order = []
+    seen = set()
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+
+        if isinstance(name, str):
+            for input_name in MetricRegistry.metric_dict[name][0]:
+                visit(input_name)
+
+        order.append(name)
+
+    for name in name_ls:
+        visit(name)
+
+    return order
+
+
+class MetricRegistry:
+    # Metric -> (inputs, function of the input values). Inputs are engine reads or other metrics.
+    metric_dict = {
+        # Intermediates
+        _GP_TTM: ((_window(QUAR_INCOME, c_api_text.FMP_GP, 4),), _same),
+        _REV_TTM: ((_window(QUAR_INCOME, c_api_text.FMP_REV, 4),), _same),
+        _CAPEX_TTM: ((_window(QUAR_CF, c_api_text.FMP_CAPEX, 4),), _same),
+        _EBIT_TTM: ((_window(QUAR_INCOME, c_api_text.FMP_EBIT, 4),), _same),
+        _EPS_2Y: ((_eps_window(5, 8),), _same),
+        _EPS_3Y: ((_eps_window(9, 12),), _same),
+        _EPS_5Y: ((_eps_window(17, 20),), _same),
+        _EPS_10Y: ((_eps_window(37, 40),), _same),
+        _REV_FY1: ((_value(ANN_INCOME, c_api_text.FMP_REV, idx=0),), _same),
+
+        # (B) Investment Metrics
+        c_text.MIND_SHARE: ((_EMPTY,), _same),
+        c_text.MKT_SHARE: ((_EMPTY,), _same),
+
+        c_text.GM_LAST_Q: ((_value(QUAR_RATIO, c_api_text.FMP_GPM, idx=0),), _same),
+        c_text.GM_TTM: ((_GP_TTM, _REV_TTM), safe_div),
+        c_text.GM_FY1: ((_value(ANN_RATIO, c_api_text.FMP_GPM, idx=0, default_value=None),), _same),
+        c_text.GM_FY3: ((_value(ANN_RATIO, c_api_text.FMP_GPM, idx=2, default_value=None),), _same),
+        c_text.GM_FY5: ((_value(ANN_RATIO, c_api_text.FMP_GPM, idx=4, default_value=None),), _same),
+        c_text.GM_FY10: ((_value(ANN_RATIO, c_api_text.FMP_GPM, idx=9, default_value=None),), _same),
+
+        c_text.EPS_CAGR_TTM: ((c_text.EPS_TTM, _EPS_2Y), _cagr(1)),
+        c_text.EPS_CAGR_3Y_TTM: ((c_text.EPS_TTM, _EPS_3Y), _cagr(3)),
+        c_text.EPS_CAGR_5Y_TTM: ((c_text.EPS_TTM, _EPS_5Y), _cagr(5)),
+        c_text.EPS_CAGR_10Y_TTM: ((c_text.EPS_TTM, _EPS_10Y), _cagr(10)),
+
+        c_text.REV_CAGR_1Y: ((_REV_FY1, _value(ANN_INCOME, c_api_text.FMP_REV, idx=1)), _cagr(1)),
+        c_text.REV_CAGR_3Y: ((_REV_FY1, _value(ANN_INCOME, c_api_text.FMP_REV, idx=2)), _cagr(3)),
+        c_text.REV_CAGR_5Y: ((_REV_FY1, _value(ANN_INCOME, c_api_text.FMP_REV, idx=4)), _cagr(5)),
+        c_text.REV_CAGR_10Y: ((_REV_FY1, _value(ANN_INCOME, c_api_text.FMP_REV, idx=9)), _cagr(10)),
+
+        c_text.ROE_TTM: ((c_text.NI_TTM, _value(QUAR_BALANCE, c_api_text.FMP_TOT_EQ, idx=0)), safe_div),
+        c_text.ROE_FY1: ((c_text.NI_LAST_Y, _value(ANN_BALANCE, c_api_text.FMP_TOT_EQ, idx=0)), safe_div),
+        c_text.ROE_FY3: ((_value(ANN_INCOME, c_api_text.FMP_NI, idx=2), _value(ANN_BALANCE, c_api_text.FMP_TOT_EQ, idx=2)), safe_div),
+        c_text.ROE_FY5: ((_value(ANN_INCOME, c_api_text.FMP_NI, idx=4), _value(ANN_BALANCE, c_api_text.FMP_TOT_EQ, idx=4)), safe_div),
+        c_text.ROE_FY10: ((_value(ANN_INCOME, c_api_text.FMP_NI, idx=9), _value(ANN_BALANCE, c_api_text.FMP_TOT_EQ, idx=9)), safe_div),
+
+        c_text.CAPEX_NI_TTM: ((_CAPEX_TTM, c_text.NI_TTM), safe_div),
+        c_text.CAPEX_NI_5Y_AVG: ((_window(ANN_CF, c_api_text.FMP_CAPEX, 5), _window(ANN_INCOME, c_api_text.FMP_NI, 5)), safe_div),
+        c_text.CAPEX_NI_10Y_AVG: ((_window(ANN_CF, c_api_text.FMP_CAPEX, 10), _window(ANN_INCOME, c_api_text.FMP_NI, 10)), safe_div),
+
+        # (C) Investment Risks
+        c_text.NDTE_LAST_Q: ((_value(QUAR_BALANCE, c_api_text.FMP_NET_DEBT, idx=0), _value(ANN_BALANCE, c_api_text.FMP_TOT_EQ, idx=0)), safe_div),
+        c_text.RR_LAST_FY: ((_value(ANN_CF, c_api_text.FMP_AR, idx=0), _REV_FY1), safe_div),
+        c_text.IR_LAST_FY: ((_value(ANN_CF, c_api_text.FMP_INV, idx=0), _REV_FY1), safe_div),
+
+        # (D) Valuation
+        c_text.DIV_YIELD_TTM: ((_value(RATIO_TTM, c_api_text.FMP_DIV_TTM, idx=0),), _same),
+        c_text.TRAILING_PE_TTM: ((_value(RATIO_TTM, c_api_text.FMP_PE_TTM, idx=0),), _same),
+        c_text.PEG_R_TTM: ((_value(RATIO_TTM, c_api_text.FMP_PEG_TTM, idx=0),), _same),
+        c_text.PEG_R_FY1: ((c_text.TRAILING_PE_TTM, c_text.EPS_CAGR_TTM), safe_div),
+        c_text.PEG_R_FY3: ((c_text.TRAILING_PE_TTM, c_text.EPS_CAGR_3Y_TTM), safe_div),
+
+        # (E) Financial Ratio
+        c_text.TOT_REV_LAST_Q: ((_value(QUAR_INCOME, c_api_text.FMP_REV, idx=0),), _same),
+        c_text.GP_LAST_Q: ((_value(QUAR_INCOME, c_api_text.FMP_GP, idx=0),), _same),
+        c_text.CAPEX_LAST_Y: ((_value(ANN_CF, c_api_text.FMP_CAPEX, idx=0),), _same),
+        c_text.NI_LAST_Q: ((_value(QUAR_INCOME, c_api_text.FMP_NI, idx=0),), _same),
+        c_text.NI_LAST_Y: ((_value(ANN_INCOME, c_api_text.FMP_NI, idx=0),), _same),
+        c_text.NI_TTM: ((_window(QUAR_INCOME, c_api_text.FMP_NI, 4),), _same),
+
+        c_text.EPS_TTM: ((_eps_window(1, 4),), _same),
+        c_text.LAST_EX_DIV_DT: ((
+            _value(DIV_CAL, c_api_text.FMP_RECORD_DT, idx=0, default_value=None, is_num=False),
+        ), _same),
+        c_text.LAST_DIV_VAL: ((_value(DIV_CAL, c_api_text.FMP_DIV, idx=0),), _same),
+        c_text.ROIC: ((
+            _EBIT_TTM,
+            _value(ANN_RATIO, c_api_text.FMP_EFF_TAX_R),
+            _value(QUAR_BALANCE, c_api_text.FMP_TOT_DEBT),
+            _value(QUAR_BALANCE, c_api_text.FMP_TOT_EQ),
+            _value(QUAR_BALANCE, c_api_text.FMP_CNC),
+        ), _roic),
+
+        c_text.PR_TTM: ((_value(RATIO_TTM, c_api_text.FMP_DIV_PR_TTM, idx=0),), _same),
+        c_text.NEXT_EARN_DATE: ((_earnings(c_api_text.FMP_DT, default_value=None, is_num=False),), _same),
+        c_text.NEXT_EARN_EST_EPS: ((_earnings(c_api_text.FMP_EPS_EST),), _same),
+        c_text.NEXT_EARN_EST_REV: ((_earnings(c_api_text.FMP_REV_EST),), _same),
+        c_text.BEAT_EST: ((
+            _earnings(c_api_text.FMP_EPS_ACT, is_est=False),
+            _earnings(c_api_text.FMP_EPS_EST, is_est=False),
+        ), _beat_estimate),
+        c_text.BEAT_EST_LAST_UPDATE: ((_earnings(c_api_text.FMP_DT, is_est=False, default_value=None, is_num=False),), _same),
+    }
+
+    # Output columns of each stage, in the column order of the output sheets
+    stage_col_ls = (
+        [
+            c_text.MIND_SHARE, c_text.MKT_SHARE,
+            c_text.GM_LAST_Q, c_text.GM_TTM, c_text.GM_FY1, c_text.GM_FY3, c_text.GM_FY5, c_text.GM_FY10,
+            c_text.EPS_CAGR_TTM, c_text.EPS_CAGR_3Y_TTM, c_text.EPS_CAGR_5Y_TTM, c_text.EPS_CAGR_10Y_TTM,
+            c_text.REV_CAGR_1Y, c_text.REV_CAGR_3Y, c_text.REV_CAGR_5Y, c_text.REV_CAGR_10Y,
+            c_text.ROE_TTM, c_text.ROE_FY1, c_text.ROE_FY3, c_text.ROE_FY5, c_text.ROE_FY10,
+            c_text.CAPEX_NI_TTM, c_text.CAPEX_NI_5Y_AVG, c_text.CAPEX_NI_10Y_AVG,
+        ],
+        [
+            c_text.NDTE_LAST_Q, c_text.RR_LAST_FY, c_text.IR_LAST_FY,
+        ],
+        [
+            c_text.DIV_YIELD_TTM, c_text.TRAILING_PE_TTM, c_text.PEG_R_TTM, c_text.PEG_R_FY1, c_text.PEG_R_FY3,
+        ],
+        [
+            c_text.TOT_REV_LAST_Q, c_text.GP_LAST_Q, c_text.CAPEX_LAST_Y,
+            c_text.NI_LAST_Q, c_text.NI_LAST_Y, c_text.NI_TTM,
+            c_text.EPS_TTM, c_text.LAST_EX_DIV_DT, c_text.LAST_DIV_VAL, c_text.ROIC,
+            c_text.PR_TTM, c_text.NEXT_EARN_DATE, c_text.NEXT_EARN_EST_EPS, c_text.NEXT_EARN_EST_REV,
+            c_text.BEAT_EST, c_text.BEAT_EST_LAST_UPDATE,
+        ],
+    )
+
+    @classmethod
+    def compute(cls, engine, col_ls=None, max_workers=None):
+        """
+        Evaluate the requested columns (every stage column by default) on a `MetricsEngine`.
+
+        Returns:
+            tuple: The four stage dicts (investment metrics, investment risks, valuation, financials) of
+                column -> list of values in `ticker_ls` order, holding only the requested columns.
+        """
+        stage_col_ls = cls.stage_col_ls
+        if col_ls is not None:
+            col_set = set(col_ls)
+            stage_col_ls = [[col for col in stage if col in col_set] for stage in stage_col_ls]
+
+        flat_col_ls = [col for stage in stage_col_ls for col in stage]
+        result = MetricGraph(engine, max_workers=max_workers).evaluate(flat_col_ls)
+
+        return tuple(
+            {col: engine.to_list(result[col]) for col in stage}
+            for stage in stage_col_ls
+        )
+
+
+
+class MetricGraph:
+    """
+    Lazy evaluation of `MetricRegistry` metrics over one engine.
+
+    Only the metrics the requested columns reach are computed, each once, so intermediates shared by several
+    columns (TTM net income, EPS windows, ...) are memoized. Engine reads run first in the calling thread, as the
+    engine fills its panel caches lazily. The metric functions are pure array operations, with `max_workers` > 1
+    the ones whose inputs are ready run in parallel, one dependency level at a time.
+    """
+
+    def __init__(self, engine, max_workers=None):
+        self.engine = engine
+        self.max_workers = max_workers or int(os.getenv('METRIC_MAX_WORKERS', '1'))
+        self._memo = {}
+
+    def _run(self, name):
+        input_ls, fn = MetricRegistry.metric_dict[name]
+        return fn(*[self._memo[input_name] for input_name in input_ls])
+
+    def evaluate(self, name_ls):
+        """Return metric name -> array for the given metrics."""
+        order = [name for name in _closure(name_ls) if name not in self._memo]
+
+        for read in order:
+            if isinstance(read, tuple):
+                method, *args = read
+                self._memo[read] = getattr(self.engine, method)(*args)
+
+        metric_ls = [name for name in order if isinstance(name, str)]
+        if self.max_workers <= 1:
+            for name in metric_ls:
+                self._memo[name] = self._run(name)
+        else:
+            # Dependency level of each metric, metrics of one level only read lower levels
+            level_dict = {}
+            for name in metric_ls:
+                level_dict[name] = 1 + max(
+                    (level_dict.get(input_name, 0) for input_name in MetricRegistry.metric_dict[name][0]), default=0,
+                )
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for level in sorted(set(level_dict.values())):
+                    level_ls = [name for name in metric_ls if level_dict[name] == level]
+                    for name, val in zip(level_ls, executor.map(self._run, level_ls)):
+                        self._memo[name] = val
+
+        return {name: self._memo[name] for name in name_ls}
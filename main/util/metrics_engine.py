@@ -0,0 +1,246 @@
+from operator import attrgetter
+
+import numpy as np
+
+from main.constants import c_api_text
+from main.util.ingest import Record
+from main.util.rolling import compact_panel, panel_prefix_sums, panel_window_sum
+from main.util.statement_index import StatementIndex
+from main.util.statement_store import StatementBlock
+from main.constants.c_fin_key import EARNINGS_CAL
+
+NAN = np.nan
+
+
+def safe_div(n1, n2):
+    """Element-wise n1 / n2, NaN (None) where either side is missing or n2 is zero."""
+    valid = ~np.isnan(n1) & ~np.isnan(n2) & (n2 != 0)
+    return np.divide(n1, np.where(valid, n2, 1.0), out=np.full(n1.shape, NAN), where=valid)
+
+
+def calc_cagr(latest_val, ori_val, period):
+    """
+    Element-wise CAGR, NaN (None) where either side is missing or zero.
+
+    A negative ratio has no real root for period > 1, the real part of the principal complex root is kept.
+    """
+    valid = ~np.isnan(latest_val) & ~np.isnan(ori_val) & (latest_val != 0) & (ori_val != 0)
+    ratio = np.where(valid, latest_val / np.where(valid, ori_val, 1.0), 1.0)
+
+    if period == 1:
+        result = ratio - 1.0
+    else:
+        result = np.power(ratio.astype(complex), 1 / period).real - 1.0
+
+    return np.where(valid, result, NAN)
+
+
+class MetricsEngine:
+    """
+    Array reads over a whole universe, the inputs of the `MetricRegistry` metrics.
+
+    `data_raw_financials` is normalised lazily into panels: one float64 (ticker x period) array per
+    (statement key, numeric field) with NaN for None. Every column is then a handful of vector operations
+    over all tickers instead of dozens of scalar lookups per ticker.
+
+    With `from_store` the panels are gathered from the memory-mapped columns of the `StatementStore` instead.
+
+    Reads return the registry defaults for missing rows and None for missing values, windows holding a missing
+    value and divisions by zero.
+    """
+
+    def __init__(self, data_raw_financials, ticker_ls, store=None):
+        self.data_raw_financials = data_raw_financials
+        self.store = store
+        self.ticker_ls = list(ticker_ls)
+        self.unique_ticker_ls = list(dict.fromkeys(self.ticker_ls))
+
+        # Position of each output row in the unique ticker axis, tickers may appear in several sheets
+        unique_pos = {ticker: i for i, ticker in enumerate(self.unique_ticker_ls)}
+        self._out_pos = np.array([unique_pos[ticker] for ticker in self.ticker_ls], dtype=int)
+
+        self._rows_dict = {}
+        self._n_rows_dict = {}
+        self._block_dict = {}
+        self._panel_dict = {}
+        self._prefix_dict = {}
+
+        # Row positions shared by every read, see `StatementIndex`
+        self.index = StatementIndex(self)
+
+    @classmethod
+    def from_store(cls, store, ticker_ls):
+        """Build the engine on the memory-mapped `StatementStore` instead of `data_raw_financials`."""
+        return cls(None, ticker_ls, store=store)
+
+    # Panels
+    def _rows(self, fin_key):
+        if fin_key not in self._rows_dict:
+            rows_ls = []
+            for ticker in self.unique_ticker_ls:
+                rows = (self.data_raw_financials.get(ticker) or {}).get(fin_key)
+                rows_ls.append(rows if isinstance(rows, list) else [])
+
+            self._rows_dict[fin_key] = rows_ls
+
+        return self._rows_dict[fin_key]
+
+    def n_rows(self, fin_key):
+        if fin_key not in self._n_rows_dict:
+            if self.store is not None:
+                block = self._store_block(fin_key)
+                n_rows = block.n_rows if block is not None else np.zeros(len(self.unique_ticker_ls), dtype=int)
+            else:
+                n_rows = np.array([len(rows) for rows in self._rows(fin_key)], dtype=int)
+
+            self._n_rows_dict[fin_key] = n_rows
+
+        return self._n_rows_dict[fin_key]
+
+    def _store_block(self, fin_key) -> StatementBlock:
+        if fin_key not in self._block_dict:
+            part_ls = self.store.read_parts(fin_key)
+            self._block_dict[fin_key] = StatementBlock(part_ls, self.unique_ticker_ls) if part_ls else None
+
+        return self._block_dict[fin_key]
+
+    def _block(self, fin_key):
+        """
+        (layout, rows x numeric fields array, ticker index, row position) of all rows of a statement when they are
+        `Record`s with one field layout, so a numeric field is one column scatter instead of a `get` per row.
+        None otherwise.
+        """
+        if fin_key not in self._block_dict:
+            rows_ls = self._rows(fin_key)
+            flat_rows = [row for rows in rows_ls for row in rows]
+            block = None
+
+            if len(flat_rows) > 0 and set(map(type, flat_rows)) == {Record}:
+                layout = flat_rows[0]._layout
+
+                # Layouts are interned at ingest, one object means one field layout
+                if len(set(map(id, map(attrgetter('_layout'), flat_rows)))) == 1:
+                    n_field = len(flat_rows[0]._num)
+                    flat = np.frombuffer(b''.join(map(attrgetter('_num'), flat_rows)), dtype=float)
+                    flat = flat.reshape(len(flat_rows), n_field)
+
+                    n_rows = self.n_rows(fin_key)
+                    ticker_idx = np.repeat(np.arange(len(rows_ls)), n_rows)
+                    row_pos = np.arange(len(flat_rows)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+                    block = (layout, flat, ticker_idx, row_pos)
+
+            self._block_dict[fin_key] = block
+
+        return self._block_dict[fin_key]
+
+    def _text_at(self, fin_key, field, pos, default_value):
+        """Text field of the `pos[i]`-th row of each ticker, `default_value` where pos is -1."""
+        if self.store is not None:
+            block = self._store_block(fin_key)
+            if block is not None:
+                return block.text(field, pos, default_value)
+
+        result = np.full(len(pos), default_value, dtype=object)
+        for i, rows in enumerate(self._rows(fin_key)):
+            if pos[i] >= 0:
+                result[i] = rows[pos[i]].get(field)
+
+        return result
+
+    def panel(self, fin_key, field):
+        """Return the (ticker x period) float array of a numeric field, NaN where missing."""
+        key = (fin_key, field)
+        if key not in self._panel_dict and self.store is not None:
+            arr = np.full((len(self.unique_ticker_ls), max(self.n_rows(fin_key), default=0)), NAN)
+
+            block = self._store_block(fin_key)
+            if block is not None:
+                for values, ticker_idx, row_pos in block.columns(field):
+                    arr[ticker_idx, row_pos] = values
+
+            self._panel_dict[key] = arr
+
+        if key not in self._panel_dict:
+            rows_ls = self._rows(fin_key)
+            depth = max([len(rows) for rows in rows_ls], default=0)
+            arr = np.full((len(rows_ls), depth), NAN)
+
+            block = self._block(fin_key)
+            if block is not None:
+                layout, flat, ticker_idx, row_pos = block
+                loc = layout.get(field)
+                if loc is not None and loc[0]:
+                    arr[ticker_idx, row_pos] = flat[:, loc[1]]
+
+                rows_ls = []
+
+            for i, rows in enumerate(rows_ls):
+                for j, row in enumerate(rows):
+                    val = row.get(field)
+                    if isinstance(val, (int, float)):
+                        arr[i, j] = val
+
+            self._panel_dict[key] = arr
+
+        return self._panel_dict[key]
+
+    def value(self, fin_key, field, idx=0, default_value=0.0, is_num=True):
+        """Field of the `idx`-th row of every ticker, `default_value` where the statement is shorter."""
+        pos = self.index.row_pos(fin_key, idx)
+
+        if is_num:
+            arr = self.panel(fin_key, field)
+            default_value = NAN if default_value is None else default_value
+            col = arr[:, idx] if idx < arr.shape[1] else np.full(arr.shape[0], NAN)
+            return np.where(pos >= 0, col, default_value)
+
+        return self._text_at(fin_key, field, pos, default_value)
+
+    def prefix(self, fin_key, field):
+        """Prefix sums of `field` per ticker, computed once and shared by every window over it."""
+        key = (fin_key, field)
+        if key not in self._prefix_dict:
+            self._prefix_dict[key] = panel_prefix_sums(self.panel(fin_key, field), self.n_rows(fin_key))
+
+        return self._prefix_dict[key]
+
+    def window_sum(self, fin_key, field, n, beg=0):
+        """Sum of rows `beg` to `beg + n - 1`, missing rows count as 0."""
+        return panel_window_sum(self.prefix(fin_key, field), beg, beg + n)
+
+    def earnings_window_sum(self, field, beg_n, end_n):
+        """Sum of the `beg_n`-th to `end_n`-th earnings rows where `field` is reported (1-based)."""
+        key = (EARNINGS_CAL, field, 'reported')
+        if key not in self._prefix_dict:
+            self._prefix_dict[key] = panel_prefix_sums(*compact_panel(self.panel(EARNINGS_CAL, field)))
+
+        return panel_window_sum(self._prefix_dict[key], beg_n - 1, end_n)
+
+    def earnings_first(self, field, is_est=True, default_value=0.0, is_num=True):
+        """Field of the first earnings row with an estimated (or actual) revenue."""
+        first_pos = self.index.earnings_first_pos(is_est)
+        if not is_num:
+            return self._text_at(EARNINGS_CAL, field, first_pos, default_value)
+
+        arr = self.panel(EARNINGS_CAL, field)
+        is_found = first_pos >= 0
+        result = np.full(len(first_pos), default_value, dtype=float)
+        result[is_found] = arr[is_found, first_pos[is_found]]
+
+        return result
+
+    def empty(self):
+        """All-missing column, for columns without a data source yet."""
+        return np.full(len(self.unique_ticker_ls), NAN)
+
+    # Output
+    def to_list(self, arr):
+        """Column over the unique tickers -> list in `ticker_ls` order, NaN as None."""
+        arr = arr[self._out_pos]
+        if arr.dtype == object:
+            return arr.tolist()
+
+        result = arr.astype(object)
+        result[np.isnan(arr)] = None
+
+        return result.tolist()
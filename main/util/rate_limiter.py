@@ -0,0 +1,95 @@
+import os
+import time
+
+from main.util.sqlite_store import SqliteStore, get_store_dir
+
+
+class RateLimiter(SqliteStore):
+    """
+    Token bucket shared by every thread, worker process and Streamlit session on the host.
+
+    The bucket state lives in a SQLite row and is updated inside an IMMEDIATE transaction, so concurrent callers
+    serialise on the file lock and together never exceed `calls_per_minute`.
+    """
+    schema = '''
+    CREATE TABLE IF NOT EXISTS bucket (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    '''
+
+    def __init__(self, path, calls_per_minute, burst=None, name='fmp'):
+        super().__init__(path)
+        self.name = name
+        self.rate = calls_per_minute / 60.0
+        self.burst = burst if burst is not None else max(1.0, calls_per_minute / 10.0)
+
+    def _update(self, consume=1.0, penalty=0.0):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM bucket WHERE name = ?', (self.name,)).fetchone()
+            now = time.time()
+
+            if row is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, row[0] + (now - row[1]) * self.rate)
+
+            # Concurrent pauses for the same 429 window overlap, they do not add up
+            if penalty > 0:
+                tokens = min(tokens, -penalty * self.rate)
+
+            wait = 0.0
+            if consume > 0:
+                if tokens >= consume:
+                    tokens -= consume
+                else:
+                    wait = (consume - tokens) / self.rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO bucket (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (self.name, tokens, now),
+            )
+            conn.execute('COMMIT')
+
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return wait
+
+    def acquire(self):
+        """Block until a call slot is available."""
+        while True:
+            wait = self._update()
+            if wait == 0:
+                return
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Empty the bucket so every caller on the host waits `seconds` before the next call, e.g. after a 429."""
+        self._update(consume=0.0, penalty=seconds)
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the FMP rate limiter of the host.
+
+    The budget is read from FMP_CALLS_PER_MINUTE (default 300) and FMP_RATE_BURST (default 10% of the budget).
+    """
+    global _limiter
+    if _limiter is None:
+        burst = os.getenv('FMP_RATE_BURST')
+        _limiter = RateLimiter(
+            os.getenv('FMP_RATE_LIMIT_PATH', os.path.join(get_store_dir(), 'fmp_rate_limit.sqlite3')),
+            calls_per_minute=float(os.getenv('FMP_CALLS_PER_MINUTE', 300)),
+            burst=float(burst) if burst else None,
+        )
+
+    return _limiter
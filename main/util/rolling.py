@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def panel_prefix_sums(arr, n_rows):
+    """
+    Prefix sums along the rows of a ticker x period panel, so any window sum is one subtraction.
+
+    NaN inside the `n_rows` of a ticker counts as missing, NaN past them as 0.
+
+    Returns:
+        tuple: (sums, n_missing), both of shape (n_ticker, depth + 1) where sums[:, k] is the sum of the first k
+            values (missing as 0) and n_missing[:, k] the number of missing values among them.
+    """
+    n_ticker, depth = arr.shape
+    is_nan = np.isnan(arr)
+    is_missing = is_nan & (np.arange(depth)[None, :] < n_rows[:, None])
+
+    sums = np.zeros((n_ticker, depth + 1))
+    sums[:, 1:] = np.cumsum(np.where(is_nan, 0.0, arr), axis=1)
+
+    n_missing = np.zeros((n_ticker, depth + 1), dtype=int)
+    n_missing[:, 1:] = np.cumsum(is_missing, axis=1)
+
+    return sums, n_missing
+
+
+def panel_window_sum(prefix, beg, end):
+    """
+    Sum of the values at positions [beg, end) of every ticker, positions past the end count as 0.
+
+    NaN where a value inside the window is missing.
+    """
+    sums, n_missing = prefix
+    beg = min(beg, sums.shape[1] - 1)
+    end = min(end, sums.shape[1] - 1)
+
+    total = sums[:, end] - sums[:, beg]
+    return np.where(n_missing[:, end] - n_missing[:, beg] > 0, np.nan, total)
+
+
+def compact_panel(arr):
+    """
+    Shift the reported (non NaN) values of each ticker to the front, keeping their order.
+
+    E.g. earnings rows where the actual EPS is reported, so the k-th reported value is at column k - 1.
+    """
+    has_val = ~np.isnan(arr)
+    rank = np.cumsum(has_val, axis=1) - 1
+
+    result = np.full(arr.shape, np.nan)
+    ticker_pos, col_pos = np.nonzero(has_val)
+    result[ticker_pos, rank[ticker_pos, col_pos]] = arr[ticker_pos, col_pos]
+
+    return result, has_val.sum(axis=1)
@@ -0,0 +1,447 @@
+import os
+from collections import defaultdict
+from typing import Dict
+
+import pandas as pd
+
+from main.constants import c_api_text, c_text
+from main.constants.c_fin_key import BASIC_INFO
+from main.data.condition_container import ConditionContainer
+from main.data.data_container import DataContainer
+from main.layout.layout_fetch_plan import LayoutFetchPlan
+from main.layout.layout_output_data import LayoutOutputData
+from main.layout.layout_output_format_data import LayoutOutputDataFormat
+from main.util import fmp
+from main.util.cache import get_ttl
+from main.util.exporter import Exporter
+from main.util.fetch import fetch_data
+from main.util.formatter import Formatter
+from main.util.memory_cache import MemoryCache
+from main.util.metric_registry import MetricRegistry
+from main.util.metrics_engine import MetricsEngine
+from main.util.shard import read_partial, shard_of, write_partial
+from main.util.statement_store import get_statement_store
+from main.util.writer import Writer
+
+# Sheet label -> env prefix of its ticker universe, e.g. VALUE__US_TICKERS
+UNIVERSE_ENV_DICT = {
+    c_text.LABEL__VALUE_STOCK: 'VALUE',
+    c_text.LABEL__GROWTH_STOCK: 'GROWTH',
+    c_text.LABEL__THEME_STOCK: 'THEME',
+    c_text.LABEL__WATCHLIST_STOCK: 'WATCHLIST',
+}
+
+# Section headers of the output table, each followed by its columns
+SECTION_HEADER_LS = [
+    '(A) Basic Info', '(B) Investment Metrics', '(C) Investment Risks', '(D) Valuation', '(E) Financial Ratio',
+]
+
+# Attributes holding the output columns of each section, in the order of `SECTION_HEADER_LS`
+DATA_ATTR_LS = ['data_basic_info', 'data_invest_metrics', 'data_invest_risks', 'data_valuation', 'data_fin']
+
+
+class ScreenPipeline:
+    """
+    Fetch -> compute -> export pipeline of the financial analysis screen, free of any UI.
+
+    The Streamlit page drives it with progress callbacks, the batch CLI (`batch_screen.py`) runs it headless. The
+    sheets to screen are `DataContainer`s keyed by sheet label, as filled by the page's tabs. `col_ls` narrows the
+    output columns, e.g. `LayoutOutputData.col_valuation_order` for a quick valuation screen.
+
+    With a `memory_cache` shared by the server process, profiles and statements fetched by any
+    session are served from memory until their TTL, see `main.util.cache.TTL_DICT`.
+    """
+
+    def __init__(self, data_layout_dict: Dict[str, DataContainer], force_refresh=False, use_batch=True,
+                 use_incremental=True, use_store=True, memory_cache: MemoryCache = None,
+                 col_ls=None):
+        self.data_layout_dict = data_layout_dict
+        self.col_ls = col_ls
+        self.force_refresh = force_refresh
+        self.use_batch = use_batch
+        self.use_incremental = use_incremental
+        self.use_store = use_store
+        self.memory_cache = memory_cache
+
+        self.ticker_ls = []
+        self.not_found_ticker_ls = []
+        self.stale_ticker_ls = []
+
+        self.data_basic_info = defaultdict(list)
+        self.data_invest_metrics = defaultdict(list)
+        self.data_invest_risks = defaultdict(list)
+        self.data_valuation = defaultdict(list)
+        self.data_fin = defaultdict(list)
+
+        self.raw_basic_info = defaultdict(dict)
+        self.data_raw_financials = defaultdict(dict)
+
+    @classmethod
+    def from_env(cls, sheet_ls=None, **kwargs):
+        """
+        Build the pipeline on the `{VALUE,GROWTH,THEME,WATCHLIST}__{US,CN,JP}_TICKERS` env universes.
+
+        Parameters:
+            sheet_ls (list, optional): Sheet labels to screen. Default is every sheet.
+        """
+        data_layout_dict = {}
+        for sheetname, prefix in UNIVERSE_ENV_DICT.items():
+            data_layout = DataContainer()
+            if sheet_ls is None or sheetname in sheet_ls:
+                data_layout.input_ticker__us = os.getenv(f'{prefix}__US_TICKERS') or ''
+                data_layout.input_ticker__cn = os.getenv(f'{prefix}__CN_TICKERS') or ''
+                data_layout.input_ticker__jp = os.getenv(f'{prefix}__JP_TICKERS') or ''
+
+            data_layout_dict[sheetname] = data_layout
+
+        return cls(data_layout_dict, **kwargs)
+
+    @classmethod
+    def from_tickers(cls, us='', cn='', jp='', sheetname=c_text.LABEL__WATCHLIST_STOCK, **kwargs):
+        """Build the pipeline on comma separated ticker lists per region, screened in one sheet."""
+        data_layout_dict = {}
+        for label in UNIVERSE_ENV_DICT:
+            data_layout = DataContainer()
+            if label == sheetname:
+                data_layout.input_ticker__us = us
+                data_layout.input_ticker__cn = cn
+                data_layout.input_ticker__jp = jp
+
+            data_layout_dict[label] = data_layout
+
+        return cls(data_layout_dict, **kwargs)
+
+    @classmethod
+    def default_fmt_condition(cls) -> Dict[str, ConditionContainer]:
+        """Highlight thresholds per region (dividend yield, capex / NI, EPS growth, gross margin)."""
+        return {
+            c_text.LABEL__US: ConditionContainer(0.04, -0.5, 0.1, 0.4),
+            c_text.LABEL__CN: ConditionContainer(0.05, -0.5, 0.1, 0.4),
+            c_text.LABEL__JP: ConditionContainer(0.04, -0.5, 0.1, 0.4),
+        }
+
+    def get_output_columns(self):
+        """
+        Columns to fetch and compute: `col_ls` when given, otherwise the layouts of the sheets holding tickers.
+
+        The fetch plan follows these columns, so a narrower layout requests fewer statements and less history.
+        """
+        if self.col_ls is not None:
+            return list(self.col_ls)
+
+        col_ls = []
+        for sheetname, data_layout in self.data_layout_dict.items():
+            if data_layout.is_empty():
+                continue
+
+            is_value_sheet = (sheetname == c_text.LABEL__VALUE_STOCK)
+            col_ls.extend(LayoutOutputData.col_value_order if is_value_sheet else LayoutOutputData.col_order)
+
+        return list(dict.fromkeys(col_ls))
+
+    def prepare_ticker_ls(self):
+        """Split the sheet inputs into tickers, return every ticker of every sheet."""
+        for data_layout in self.data_layout_dict.values():
+            data_layout.batch_process_ticker()
+
+        self.ticker_ls = []
+        for data_layout in self.data_layout_dict.values():
+            self.ticker_ls.extend(data_layout.master_ticker_ls)
+
+        return self.ticker_ls
+
+    def select_shard(self, shard, n_shard):
+        """Keep the tickers of one shard of the universe, see `shard.shard_of`."""
+        self.ticker_ls = [t for t in self.ticker_ls if shard_of(t, n_shard) == shard]
+
+        return self.ticker_ls
+
+    def drop_ticker_ls(self, drop_ticker_ls):
+        """Remove tickers from the screen and from the sheets."""
+        self.ticker_ls = list(filter(lambda x: x not in drop_ticker_ls, self.ticker_ls))
+
+        for k, v in self.data_layout_dict.items():
+            v.us_ticker_ls = list(filter(lambda x: x not in drop_ticker_ls, v.us_ticker_ls))
+            v.cn_ticker_ls = list(filter(lambda x: x not in drop_ticker_ls, v.cn_ticker_ls))
+            v.jp_ticker_ls = list(filter(lambda x: x not in drop_ticker_ls, v.jp_ticker_ls))
+
+    def fetch_basic_info(self):
+        """
+        Fetch the company profiles, tickers without one are dropped from the screen.
+
+        Returns:
+            list: Tickers not found.
+        """
+        not_found_ticker_ls = []
+
+        # Profiles fetched by any session of the process
+        if self.memory_cache is not None and not self.force_refresh:
+            for ticker in self.ticker_ls:
+                profile = self.memory_cache.get(('profile', ticker))
+                if profile is not None:
+                    self.raw_basic_info[ticker] = profile
+
+        # Batched mode: fetch every missing profile with a handful of multi-symbol requests
+        if self.use_batch:
+            missing_ticker_ls = [t for t in self.ticker_ls if t not in self.raw_basic_info.keys()]
+            profile_dict = fmp.fetch_profiles(missing_ticker_ls, refresh=self.force_refresh)
+            self.raw_basic_info.update(profile_dict)
+            self._remember_profiles(profile_dict)
+
+        for ticker in self.ticker_ls:
+            if not ticker in self.raw_basic_info.keys():
+                if self.use_batch:
+                    not_found_ticker_ls.append(ticker)
+                    continue
+
+                url = fmp.build_profile_url([ticker])
+                result_ls = fetch_data(url, fin_key=BASIC_INFO, refresh=self.force_refresh, project=True)
+
+                if len(result_ls) == 0:
+                    not_found_ticker_ls.append(ticker)
+                    continue
+
+                self.raw_basic_info[ticker] = result_ls[0]  # Store the result
+                self._remember_profiles({ticker: result_ls[0]})
+
+            result = self.raw_basic_info[ticker]
+
+            cur_ticker = result.get(c_api_text.FMP_SYMBOL)
+
+            self.data_basic_info[c_text.COMPANY_NAME].append(result.get(c_api_text.FMP_COMP_NAME))
+            self.data_basic_info[c_text.TICKER].append(cur_ticker)
+            self.data_basic_info[c_text.SECTOR].append(result.get(c_api_text.FMP_SECTOR))
+            self.data_basic_info[c_text.CCY].append(result.get(c_api_text.FMP_CCY))
+            self.data_basic_info[c_text.CUR_PRICE].append(result.get(c_api_text.FMP_PRICE))
+            self.data_basic_info[c_text.MKT_CAP].append(result.get(c_api_text.FMP_MKT_CAP))
+            self.data_basic_info[c_text.BETA].append(result.get(c_api_text.FMP_BETA))
+
+        # Remove non found ticker
+        if len(not_found_ticker_ls) > 0:
+            self.drop_ticker_ls(not_found_ticker_ls)
+
+        self.not_found_ticker_ls.extend(not_found_ticker_ls)
+
+        return not_found_ticker_ls
+
+    def _remember_profiles(self, profile_dict):
+        if self.memory_cache is not None:
+            for ticker, profile in profile_dict.items():
+                self.memory_cache.set(('profile', ticker), profile, get_ttl(BASIC_INFO))
+
+    def _recall_statements(self, limits):
+        """ticker -> fin_key -> rows of the tickers with every planned statement in memory, deep enough."""
+        recalled_dict = {}
+        if self.memory_cache is None or self.force_refresh:
+            return recalled_dict
+
+        for ticker in dict.fromkeys(self.ticker_ls):
+            fin_dict = {}
+            for fin_key, limit in limits.items():
+                cached = self.memory_cache.get(('statement', ticker, fin_key))
+                if cached is None or cached[0] < limit:
+                    break
+
+                fin_dict[fin_key] = cached[1][:limit]
+            else:
+                recalled_dict[ticker] = fin_dict
+
+        return recalled_dict
+
+    def _remember_statements(self, results, limits):
+        # Failed fetches (not a list) are left out, the next run retries them
+        if self.memory_cache is not None:
+            for ticker, fin_dict in results.items():
+                for fin_key, rows in fin_dict.items():
+                    if isinstance(rows, list):
+                        self.memory_cache.set(('statement', ticker, fin_key), (limits[fin_key], rows), get_ttl(fin_key))
+
+    def fetch_statements(self, on_progress=None, on_ticker=None, max_concurrency=None):
+        """
+        Fetch the statements the output columns read, see `fmp.fetch_financials` for the callbacks.
+
+        Returns:
+            dict: ticker -> fin_key -> rows of the tickers fetched, tickers served from memory are left out.
+        """
+        # Only the statements and history depth the output columns read
+        limits = LayoutFetchPlan.plan(self.get_output_columns())
+
+        recalled_dict = self._recall_statements(limits)
+        if on_ticker is not None:
+            for ticker, fin_dict in recalled_dict.items():
+                on_ticker(ticker, fin_dict)
+
+        # All (ticker, endpoint) pairs of the other tickers run concurrently under one event loop
+        results = fmp.fetch_financials([t for t in self.ticker_ls if t not in recalled_dict], limits=limits,
+                                       max_concurrency=max_concurrency, refresh=self.force_refresh,
+                                       batch=self.use_batch, incremental=self.use_incremental,
+                                       on_progress=on_progress, on_ticker=on_ticker)
+        self._remember_statements(results, limits)
+
+        self.data_raw_financials.update(recalled_dict)
+        self.data_raw_financials.update(results)
+
+        return results
+
+    def store_statements(self, results):
+        if self.use_store:
+            get_statement_store().write_financials(results)
+
+    def get_preview_rows(self, fin_dict_by_ticker):
+        """Output rows of the given tickers alone, in the final column order, e.g. to stream them while fetching."""
+        ticker_ls = list(fin_dict_by_ticker.keys())
+        engine = MetricsEngine(fin_dict_by_ticker, ticker_ls)
+        stage_ls = MetricRegistry.compute(engine, self.get_output_columns())
+
+        row_ls = []
+        for i, ticker in enumerate(ticker_ls):
+            basic_info = self.raw_basic_info.get(ticker, {})
+            row = {
+                c_text.COMPANY_NAME: basic_info.get(c_api_text.FMP_COMP_NAME),
+                c_text.TICKER: ticker,
+                c_text.SECTOR: basic_info.get(c_api_text.FMP_SECTOR),
+                c_text.CCY: basic_info.get(c_api_text.FMP_CCY),
+                c_text.CUR_PRICE: basic_info.get(c_api_text.FMP_PRICE),
+                c_text.MKT_CAP: basic_info.get(c_api_text.FMP_MKT_CAP),
+                c_text.BETA: basic_info.get(c_api_text.FMP_BETA),
+            }
+            for stage in stage_ls:
+                row.update({k: v[i] for k, v in stage.items()})
+
+            row_ls.append({col: row.get(col) for col in LayoutOutputData.col_order})
+
+        return row_ls
+
+    def _find_stale_ticker_ls(self, engine):
+        """Tickers with a failed statement fetch whose metrics read the rows stored by an earlier run instead."""
+        stale_ticker_dict = {}
+        for fin_key in LayoutFetchPlan.plan(self.get_output_columns()):
+            n_rows = engine.n_rows(fin_key)
+            for i, ticker in enumerate(engine.unique_ticker_ls):
+                rows = self.data_raw_financials.get(ticker, {}).get(fin_key)
+                if not isinstance(rows, list) and n_rows[i] > 0:
+                    stale_ticker_dict[ticker] = None
+
+        return list(stale_ticker_dict)
+
+    def compute_metrics(self):
+        if self.use_store:
+            # Panels gathered from the memory-mapped columns, a failed fetch falls back to the last stored rows
+            engine = MetricsEngine.from_store(get_statement_store(), self.ticker_ls)
+            self.stale_ticker_ls = self._find_stale_ticker_ls(engine)
+        else:
+            engine = MetricsEngine(self.data_raw_financials, self.ticker_ls)
+
+        # Only the columns of the active layout, through the metric dependency graph
+        invest_metrics, invest_risks, valuation, fin = MetricRegistry.compute(engine, self.get_output_columns())
+
+        self.data_invest_metrics.update(invest_metrics)
+        self.data_invest_risks.update(invest_risks)
+        self.data_valuation.update(valuation)
+        self.data_fin.update(fin)
+
+    def run(self, on_progress=None, on_ticker=None, max_concurrency=None, shard=None, n_shard=1):
+        """
+        Run every stage, return the output table (None when there is no ticker to screen).
+
+        Parameters:
+            shard (int, optional): Only run this shard (0-based) of an `n_shard` split of the universe.
+        """
+        self.prepare_ticker_ls()
+        if shard is not None:
+            self.select_shard(shard, n_shard)
+
+        if len(self.ticker_ls) == 0:
+            return None
+
+        self.fetch_basic_info()
+        results = self.fetch_statements(on_progress=on_progress, on_ticker=on_ticker, max_concurrency=max_concurrency)
+        self.store_statements(results)
+        self.compute_metrics()
+
+        return self.build_dataframe()
+
+    def build_dataframe(self):
+        """Output table, one row per ticker of `ticker_ls` with raw numbers in `LayoutOutputData.col_order`."""
+        if len(self.ticker_ls) == 0:
+            return None
+
+        df_ls = []
+        for header, attr in zip(SECTION_HEADER_LS, DATA_ATTR_LS):
+            df_ls.append(pd.DataFrame([None], columns=[header]))
+            df_ls.append(pd.DataFrame(getattr(self, attr)))
+
+        raw_data_df = pd.concat(df_ls, axis=1)
+
+        # Columns outside the screened layouts are not computed, they are left blank
+        return raw_data_df.reindex(columns=LayoutOutputData.col_order)
+
+    def save_partial(self, path, shard, n_shard):
+        """Write the computed rows of a shard run, to be assembled by `merge_partials`."""
+        write_partial(path, {
+            'shard': shard,
+            'n_shard': n_shard,
+            'ticker_ls': self.ticker_ls,
+            'not_found_ticker_ls': self.not_found_ticker_ls,
+            'stale_ticker_ls': self.stale_ticker_ls,
+            'data': {attr: getattr(self, attr) for attr in DATA_ATTR_LS},
+        })
+
+    def merge_partials(self, path_ls):
+        """
+        Assemble the rows of shard runs in the order of the full universe, as if it was run in one process.
+
+        Call on a pipeline built on the same sheets as the shards, its output table is then `build_dataframe()`.
+        Raises a ValueError naming the tickers no partial covers, e.g. the universe changed since the shard runs.
+        """
+        self.prepare_ticker_ls()
+
+        row_dict = {}  # ticker -> (data of its shard, position in the shard)
+        data_ls = []
+        not_found_ticker_ls = []
+        for path in path_ls:
+            partial = read_partial(path)
+            data_ls.append(partial['data'])
+            not_found_ticker_ls.extend(partial['not_found_ticker_ls'])
+            self.stale_ticker_ls.extend(t for t in partial.get('stale_ticker_ls', []) if t not in self.stale_ticker_ls)
+            for pos, ticker in enumerate(partial['ticker_ls']):
+                row_dict.setdefault(ticker, (partial['data'], pos))
+
+        # Remove non found ticker
+        self.not_found_ticker_ls.extend(dict.fromkeys(not_found_ticker_ls))
+        if len(not_found_ticker_ls) > 0:
+            self.drop_ticker_ls(set(not_found_ticker_ls))
+
+        missing_ticker_ls = list(dict.fromkeys(t for t in self.ticker_ls if t not in row_dict))
+        if len(missing_ticker_ls) > 0:
+            raise ValueError(f'No partial result for {missing_ticker_ls}')
+
+        for attr in DATA_ATTR_LS:
+            col_ls = dict.fromkeys(col for data in data_ls for col in data[attr])
+            for col in col_ls:
+                for ticker in self.ticker_ls:
+                    data, pos = row_dict[ticker]
+                    getattr(self, attr)[col].append(data[attr][col][pos] if col in data[attr] else None)
+
+    @classmethod
+    def format_dataframe(cls, df: pd.DataFrame):
+        """Format huge numbers to K, M, B."""
+        copy_df = df.copy()
+        for col in copy_df.columns.tolist():
+            if col in LayoutOutputDataFormat.txt_col_ls:
+                copy_df[col] = copy_df[col].apply(Formatter.format_number)
+
+        return copy_df
+
+    def to_excel(self, raw_data_df: pd.DataFrame, fmt_condition: Dict[str, ConditionContainer]):
+        """Formatted workbook of the sheets, as bytes."""
+        return Writer.convert_df_to_excel(self.format_dataframe(raw_data_df), self.data_layout_dict, fmt_condition)
+
+    def stream_excel(self, raw_data_df: pd.DataFrame, fmt_condition: Dict[str, ConditionContainer], output):
+        """Formatted workbook of the sheets streamed to a path or binary stream, in bounded memory."""
+        Writer.stream_df_to_excel(output, raw_data_df, self.data_layout_dict, fmt_condition,
+                                  format_fn=self.format_dataframe)
+
+    def export_table(self, raw_data_df: pd.DataFrame, output, fmt):
+        """Raw output table with its sheet and region columns as Parquet, Arrow IPC, CSV or JSONL, see `Exporter`."""
+        Exporter.write(Exporter.to_table(raw_data_df, self.data_layout_dict), output, fmt)
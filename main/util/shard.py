@@ -0,0 +1,47 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+
+
+def shard_of(ticker, n_shard):
+    """
+    Shard of a ticker, from a hash of the symbol alone.
+
+    A ticker stays in the same shard whatever the rest of the universe is, so a shard can be re-run on its own
+    and its stores (statement history, metric cache) keep serving the same tickers.
+    """
+    return int.from_bytes(hashlib.blake2b(ticker.encode(), digest_size=8).digest(), 'big') % n_shard
+
+
+def shard_path(shard_dir, shard, n_shard):
+    return os.path.join(shard_dir, f'shard-{shard:03d}-of-{n_shard:03d}.json')
+
+
+def write_partial(path, partial):
+    """Write a partial result atomically, a crashed shard leaves no file behind."""
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(partial, f)
+
+    os.replace(tmp_path, path)
+
+
+def read_partial(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def missing_shard_ls(shard_dir, n_shard):
+    """Shards of an `n_shard` split without a partial result in `shard_dir`."""
+    return [i for i in range(n_shard) if not os.path.exists(shard_path(shard_dir, i, n_shard))]
+
+
+def clear_partials(shard_dir, n_shard):
+    for path in glob.glob(os.path.join(shard_dir, f'shard-*-of-{n_shard:03d}.json')):
+        os.remove(path)
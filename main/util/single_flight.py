@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution.
+
+    The first caller of a key runs the function, callers arriving while it is in flight wait for its result
+    instead of running it again. Once the call completes the key is released, later callers run it anew.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flight_dict = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._flight_dict.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._flight_dict[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+
+        finally:
+            with self._lock:
+                del self._flight_dict[key]
+
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flight_dict)
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    """
+    Base class of the local SQLite stores.
+
+    A connection is opened per thread and per process, in WAL mode so Streamlit sessions and worker processes
+    on the same host can read and write the file concurrently.
+    """
+    schema = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            dir_name = os.path.dirname(self.path)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.schema)
+
+            self._local.conn = conn
+            self._local.pid = pid
+
+        return self._local.conn
+
+
+def get_store_dir():
+    return os.getenv('FMP_STORE_DIR', '.cache')
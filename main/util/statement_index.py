@@ -0,0 +1,37 @@
+import numpy as np
+
+from main.constants import c_api_text
+from main.constants.c_fin_key import EARNINGS_CAL
+
+
+class StatementIndex:
+    """
+    Row positions of the statements of a universe, the lookup layer of `MetricsEngine`.
+
+    A (statement, field, idx) read is the `idx` column of the field's panel where the ticker has that row, so the
+    index only keeps each ticker's row count. The positions of the first earnings row with an estimated and with an
+    actual revenue are found once for every ticker instead of on every read.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._first_pos_dict = {}
+
+    def row_pos(self, fin_key, idx):
+        """Position `idx` for tickers with more than `idx` rows of the statement, -1 for the others."""
+        return np.where(self.engine.n_rows(fin_key) > idx, idx, -1)
+
+    def earnings_first_pos(self, is_est=True):
+        """Position of the first earnings row with an estimated (or actual) revenue of each ticker, -1 if none."""
+        if is_est not in self._first_pos_dict:
+            flag_field = c_api_text.FMP_REV_EST if is_est else c_api_text.FMP_REV_ACT
+            has_flag = ~np.isnan(self.engine.panel(EARNINGS_CAL, flag_field))
+
+            if has_flag.shape[1] > 0:
+                first_pos = np.where(has_flag.any(axis=1), has_flag.argmax(axis=1), -1)
+            else:
+                first_pos = np.full(has_flag.shape[0], -1, dtype=int)
+
+            self._first_pos_dict[is_est] = first_pos
+
+        return self._first_pos_dict[is_est]
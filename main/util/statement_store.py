@@ -0,0 +1,341 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, writes are only serialised within the process
+    fcntl = None
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from main.constants import c_api_text
+from main.util.ingest import PROJECTED_FIELD_SET
+from main.util.sqlite_store import get_store_dir
+
+SYMBOL_COL = 'symbol'
+ROW_COL = 'row'
+
+PART_PREFIX = 'part-'
+PART_SUFFIX = '.arrow'
+
+# Parts of a statement merged into one by the write that exceeds this count
+MAX_PART = 16
+
+# Re-listings of the parts when a concurrent write merged them away during a read
+MAX_READ_RETRY = 3
+
+# Projected fields holding text, the other projected fields are numeric and the period date is a date32.
+# Their types are fixed so every write batch has the same schema, whatever values the batch holds.
+TEXT_FIELD_SET = frozenset([
+    c_api_text.FMP_CCY, c_api_text.FMP_COMP_NAME, c_api_text.FMP_RECORD_DT, c_api_text.FMP_SECTOR,
+    c_api_text.FMP_SYMBOL,
+])
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+def _to_float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `{path}.lock` across processes, e.g. shard workers writing the same statement file."""
+    if fcntl is None:
+        yield
+        return
+
+    with open(f'{path}.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class StatementStore:
+    """
+    Columnar store of the fetched statements on Arrow IPC files, one directory per statement and period:
+        {root}/{statement}/{period}/part-{seq}.arrow
+
+    Every write appends one part file with the rows of its tickers, the rows of other tickers are never rewritten.
+    A ticker is read from the newest part holding it, and once a statement has more than `MAX_PART` parts they are
+    merged into one so readers keep opening a handful of files.
+
+    Each part holds one row per (symbol, row) sorted by symbol then row (0 = newest), a typed date32 `date` column
+    (null when missing or not a date), float64 columns for numeric fields (None stored as NaN, so readers get numpy
+    views without a validity mask) and string columns for the other fields. The types of the projected fields are
+    fixed, see `TEXT_FIELD_SET`, the others are inferred and fall back to string when two parts disagree. Parts are
+    written uncompressed and renamed into place, so readers can memory-map them and slice columns without copying.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def dir_path(self, fin_key):
+        # Late import, fmp imports the fetch layer which may write here
+        from main.util.fmp import STATEMENT_ENDPOINTS
+
+        endpoint, period = STATEMENT_ENDPOINTS[fin_key]
+        return os.path.join(self.root, endpoint, period or 'all')
+
+    def _part_name_ls(self, fin_key):
+        """File names of the parts of a statement, oldest first."""
+        dir_path = self.dir_path(fin_key)
+        if not os.path.isdir(dir_path):
+            return []
+
+        return sorted(f for f in os.listdir(dir_path) if f.startswith(PART_PREFIX) and f.endswith(PART_SUFFIX))
+
+    def read_parts(self, fin_key):
+        """Memory-map the part tables of a statement, oldest first, [] when it was never written."""
+        dir_path = self.dir_path(fin_key)
+        for i in range(MAX_READ_RETRY + 1):
+            try:
+                part_ls = []
+                for name in self._part_name_ls(fin_key):
+                    with pa.memory_map(os.path.join(dir_path, name), 'r') as source:
+                        part_ls.append(pa.ipc.open_file(source).read_all())
+
+                return part_ls
+            except FileNotFoundError:
+                # The parts were merged by a concurrent write between the listing and the open
+                if i == MAX_READ_RETRY:
+                    raise
+
+    def read(self, fin_key) -> pa.Table:
+        """Current rows of a statement in one table, each ticker from its newest part. None when never written."""
+        part_ls = self.read_parts(fin_key)
+        if len(part_ls) == 0:
+            return None
+
+        return self._merge(part_ls)
+
+    def _merge(self, part_ls):
+        table = part_ls[0]
+        for part in part_ls[1:]:
+            keep_mask = pc.invert(pc.is_in(table[SYMBOL_COL], value_set=pc.unique(part[SYMBOL_COL])))
+            old_table, new_table = self._unify(table.filter(keep_mask), part)
+            table = pa.concat_tables([old_table, new_table], promote_options='permissive')
+
+        return table.sort_by([(SYMBOL_COL, 'ascending'), (ROW_COL, 'ascending')])
+
+    def _build_table(self, rows_dict):
+        field_ls = []
+        is_num_dict = {}
+        for rows in rows_dict.values():
+            for row in rows:
+                for k in row.keys():
+                    if k not in is_num_dict:
+                        field_ls.append(k)
+                        is_num_dict[k] = k not in TEXT_FIELD_SET
+
+                    val = row.get(k)
+                    if val is not None and not _is_number(val) and k not in PROJECTED_FIELD_SET:
+                        is_num_dict[k] = False
+
+        symbol_ls = []
+        row_ls = []
+        col_dict = {f: [] for f in field_ls if f != SYMBOL_COL}
+        for ticker, rows in rows_dict.items():
+            for i, row in enumerate(rows):
+                symbol_ls.append(ticker)
+                row_ls.append(i)
+                for f, values in col_dict.items():
+                    values.append(row.get(f))
+
+        arrays = {SYMBOL_COL: pa.array(symbol_ls, pa.string()), ROW_COL: pa.array(row_ls, pa.int16())}
+        for f, values in col_dict.items():
+            if f == c_api_text.FMP_DT:
+                arrays[f] = self._to_date(pa.array([None if v is None else str(v) for v in values], pa.string()))
+            elif is_num_dict[f]:
+                arrays[f] = pa.array(np.array([np.nan if v is None else _to_float(v) for v in values], dtype=float))
+            else:
+                arrays[f] = pa.array([None if v is None else str(v) for v in values], pa.string())
+
+        return pa.table(arrays).sort_by([(SYMBOL_COL, 'ascending'), (ROW_COL, 'ascending')])
+
+    def _to_date(self, arr):
+        # Date part of 'YYYY-MM-DD[ HH:MM:SS]', null when it is not a date
+        date_arr = pc.strptime(pc.utf8_slice_codeunits(arr, 0, 10), format='%Y-%m-%d', unit='s', error_is_null=True)
+        return pc.cast(date_arr, pa.date32())
+
+    def _unify(self, old_table, new_table):
+        """Cast the columns of two tables to common types, a field inferred differently by two writes is string."""
+        for f in set(old_table.column_names) & set(new_table.column_names):
+            old_type = old_table.schema.field(f).type
+            new_type = new_table.schema.field(f).type
+            if old_type == new_type:
+                continue
+
+            col_ls = []
+            for table in (old_table, new_table):
+                col = table[f]
+                if pa.types.is_floating(col.type):
+                    col = pc.if_else(pc.is_nan(col), pa.scalar(None, col.type), col)
+                col_ls.append(pc.cast(col, pa.string()))
+
+            old_table = old_table.set_column(old_table.schema.get_field_index(f), f, col_ls[0])
+            new_table = new_table.set_column(new_table.schema.get_field_index(f), f, col_ls[1])
+
+        return old_table, new_table
+
+    def _write_file(self, dir_path, table):
+        tmp_path = os.path.join(dir_path, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        return tmp_path
+
+    def write(self, fin_key, rows_dict):
+        """
+        Write the rows of the given tickers of a statement as a new part, rows of other tickers are kept.
+
+        Parameters:
+            fin_key (str): Statement key.
+            rows_dict (dict): ticker -> list of rows (dict or `Record`), newest first.
+        """
+        dir_path = self.dir_path(fin_key)
+        os.makedirs(dir_path, exist_ok=True)
+
+        tmp_path = self._write_file(dir_path, self._build_table(rows_dict))
+
+        # Parts are numbered and merged under a thread and a process lock, e.g. shard workers on the same store
+        with self._lock, _file_lock(os.path.join(dir_path, 'parts')):
+            name_ls = self._part_name_ls(fin_key)
+            seq = int(name_ls[-1][len(PART_PREFIX):-len(PART_SUFFIX)]) + 1 if name_ls else 0
+            os.replace(tmp_path, os.path.join(dir_path, f'{PART_PREFIX}{seq:010d}{PART_SUFFIX}'))
+
+            if len(name_ls) + 1 > MAX_PART:
+                self._compact(fin_key)
+
+    def _compact(self, fin_key):
+        """Merge the parts of a statement into its newest part, call under the write locks."""
+        dir_path = self.dir_path(fin_key)
+        name_ls = self._part_name_ls(fin_key)
+
+        tmp_path = self._write_file(dir_path, self._merge(self.read_parts(fin_key)))
+        os.replace(tmp_path, os.path.join(dir_path, name_ls[-1]))
+        for name in name_ls[:-1]:
+            os.remove(os.path.join(dir_path, name))
+
+    def write_financials(self, data_raw_financials):
+        """Write every statement of a `data_raw_financials` structure, failed fetches (not a list) are skipped."""
+        rows_by_key = {}
+        for ticker, fin_dict in data_raw_financials.items():
+            for fin_key, rows in fin_dict.items():
+                if isinstance(rows, list):
+                    rows_by_key.setdefault(fin_key, {})[ticker] = rows
+
+        for fin_key, rows_dict in rows_by_key.items():
+            self.write(fin_key, rows_dict)
+
+
+class StatementBlock:
+    """
+    Read-only view of one statement of a universe for the metrics engine, over the memory-mapped part tables.
+
+    Each ticker is read from the newest part holding it. `segment_ls` gives, for every part, the table rows of its
+    tickers (a slice when they are contiguous, e.g. a part written for the whole universe) with the panel
+    coordinates of each row, so numeric columns are sliced from the mapped file straight into the panel.
+    """
+
+    def __init__(self, part_ls, ticker_ls):
+        ticker_pos = {ticker: i for i, ticker in enumerate(ticker_ls)}
+
+        self.part_ls = part_ls
+        self.segment_ls = []  # (part index, table rows, ticker index, row position)
+
+        seen_symbol_set = set()
+        for part_idx in reversed(range(len(part_ls))):
+            table = part_ls[part_idx]
+            symbol_ls = table[SYMBOL_COL].to_pylist()
+
+            table_pos = np.array(
+                [i for i, s in enumerate(symbol_ls) if s in ticker_pos and s not in seen_symbol_set], dtype=int,
+            )
+            seen_symbol_set.update(symbol_ls)
+            if len(table_pos) == 0:
+                continue
+
+            ticker_idx = np.array([ticker_pos[symbol_ls[i]] for i in table_pos], dtype=int)
+            row_pos = table[ROW_COL].to_numpy()[table_pos].astype(int)
+            if table_pos[-1] - table_pos[0] + 1 == len(table_pos):
+                table_pos = slice(int(table_pos[0]), int(table_pos[-1]) + 1)
+
+            self.segment_ls.append((part_idx, table_pos, ticker_idx, row_pos))
+
+        ticker_idx = np.concatenate([seg[2] for seg in self.segment_ls] or [np.zeros(0, dtype=int)])
+        self.n_rows = np.bincount(ticker_idx, minlength=len(ticker_ls))
+
+        # (ticker, row) -> part and table row, -1 where missing
+        shape = (len(ticker_ls), max(self.n_rows, default=0))
+        self.part_panel = np.full(shape, -1, dtype=int)
+        self.index_panel = np.full(shape, -1, dtype=int)
+        for part_idx, table_pos, ticker_idx, row_pos in self.segment_ls:
+            if isinstance(table_pos, slice):
+                table_pos = np.arange(table_pos.start, table_pos.stop)
+
+            self.part_panel[ticker_idx, row_pos] = part_idx
+            self.index_panel[ticker_idx, row_pos] = table_pos
+
+    def columns(self, field):
+        """
+        Yield (values, ticker index, row position) of each part holding `field` as a numeric column.
+
+        Values are a slice of the memory-mapped column, or taken from it when the part's tickers are not contiguous.
+        """
+        for part_idx, table_pos, ticker_idx, row_pos in self.segment_ls:
+            table = self.part_ls[part_idx]
+            if field not in table.column_names or table.schema.field(field).type != pa.float64():
+                continue
+
+            col = table[field]
+            if isinstance(table_pos, slice):
+                values = col.slice(table_pos.start, table_pos.stop - table_pos.start).to_numpy()
+            else:
+                values = col.take(pa.array(table_pos)).to_numpy()
+
+            yield values, ticker_idx, row_pos
+
+    def text(self, field, pos, default_value):
+        """Text field of the `pos[i]`-th row of each ticker, dates as 'YYYY-MM-DD', `default_value` where pos is -1."""
+        result = np.full(len(pos), default_value, dtype=object)
+
+        has_pos = pos >= 0
+        result[has_pos] = None
+
+        ticker_idx = np.nonzero(has_pos)[0]
+        part_idx_arr = self.part_panel[ticker_idx, pos[has_pos]]
+        index = self.index_panel[ticker_idx, pos[has_pos]]
+        for part_idx in np.unique(part_idx_arr):
+            table = self.part_ls[part_idx]
+            if field not in table.column_names:
+                continue
+
+            mask = part_idx_arr == part_idx
+            values = table[field].take(pa.array(index[mask])).to_pylist()
+            result[ticker_idx[mask]] = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+
+        return result
+
+
+_store = None
+
+
+def get_statement_store() -> StatementStore:
+    global _store
+    if _store is None:
+        _store = StatementStore(os.getenv('FMP_STATEMENT_STORE_PATH', os.path.join(get_store_dir(), 'statements')))
+
+    return _store
@@ -1,12 +1,10 @@
-from copy import copy
+import math
 from typing import Dict
 import pandas as pd
 from io import BytesIO
 
-import streamlit as st
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+import xlsxwriter
+from xlsxwriter.utility import xl_rowcol_to_cell
 
 from main.constants import c_text
 from main.data.condition_container import ConditionContainer
@@ -14,372 +12,339 @@ from main.data.data_container import DataContainer
 from main.layout.layout_output_data import LayoutOutputData
 from main.layout.layout_output_format_data import LayoutOutputDataFormat
 
+# Region label and the ticker list attribute of its block, in sheet order
+REGION_LS = [
+    ('US', c_text.LABEL__US, 'us_ticker_ls'),
+    ('CN', c_text.LABEL__CN, 'cn_ticker_ls'),
+    ('JP', c_text.LABEL__JP, 'jp_ticker_ls'),
+]
+
+# Condition -> highlighted columns and their fill colour
+COND_COL_DICT = {
+    'div': [c_text.DIV_YIELD_TTM],
+    'capex': [c_text.CAPEX_NI_TTM, c_text.CAPEX_NI_5Y_AVG, c_text.CAPEX_NI_10Y_AVG],
+    'eps': [c_text.EPS_CAGR_TTM, c_text.EPS_CAGR_3Y_TTM, c_text.EPS_CAGR_5Y_TTM, c_text.EPS_CAGR_10Y_TTM],
+    'gm': [c_text.GM_LAST_Q, c_text.GM_TTM, c_text.GM_FY1, c_text.GM_FY3],
+}
+
+FILL_COLOR_DICT = {
+    'div': '#FDE9D9',
+    'capex': '#DAEEF3',
+    'eps': '#E4DFEC',
+    'gm': '#C5D9F1',
+}
+
+HEADER_COLOR = '#D9D9D9'
+COND_HEADER_COLOR = '#DAEEF3'
+
+DT_COL_LS = [c_text.NEXT_EARN_DATE, c_text.BEAT_EST_LAST_UPDATE, c_text.LAST_EX_DIV_DT]
+
+# Rows of a region block sliced (and formatted) at once by the streaming export
+STREAM_CHUNK_SIZE = 1000
+
+
+class FormatCache:
+    """xlsxwriter formats by their properties, a workbook holds one format per distinct style."""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self._format_dict = {}
+        self._dxf_format_dict = {}
+
+    def get(self, **props):
+        key = tuple(sorted(props.items()))
+        if key not in self._format_dict:
+            self._format_dict[key] = self.workbook.add_format(props)
+
+        return self._format_dict[key]
+
+    def get_dxf(self, **props):
+        """Format of conditional-format rules, kept apart from the cell formats of the same style."""
+        key = tuple(sorted(props.items()))
+        if key not in self._dxf_format_dict:
+            self._dxf_format_dict[key] = self.workbook.add_format(props)
+
+        return self._dxf_format_dict[key]
+
+
 class Writer:
     @classmethod
-    def apply_conditional_formatting(cls, ws, fmt_condition, sheet_df, country_label, ticker_list, gap_ptr):
+    def get_column_props(cls, col_order_ls):
+        """Cell properties of the data cells of each column: border, number format and alignment."""
+        props_ls = []
+        for col in col_order_ls:
+            props = {'border': 1}
+
+            if col in LayoutOutputDataFormat.pct_col_ls:
+                props['num_format'] = '0.0%'
+            elif col in LayoutOutputDataFormat.num_one_decim_col_ls:
+                props['num_format'] = '#,##0.0'
+            elif col in LayoutOutputDataFormat.num_three_decim_col_ls:
+                props['num_format'] = '#,##0.000'
+
+            if col in DT_COL_LS or col == c_text.CCY:
+                props.update({'text_wrap': True, 'align': 'center'})
+            elif col in LayoutOutputDataFormat.txt_col_ls:
+                props.update({'text_wrap': True, 'align': 'right'})
+
+            props_ls.append(props)
+
+        return props_ls
+
+    @classmethod
+    def apply_conditional_formatting(cls, ws, col_order_ls, condition: ConditionContainer, first_row, last_row,
+                                     fmt_cache: FormatCache):
         """
-        Apply conditional formatting based on given conditions.
-
-        :param ws: Excel Worksheet object
-        :param fmt_condition: Dictionary containing formatting conditions
-        :param sheet_df: DataFrame representing the sheet data
-        :param country_label: Country label key for accessing formatting conditions
-        :param ticker_list: List of tickers for the given country
-        :param gap_ptr: The starting row index for the country
-        :return: Updated gap_ptr
+        Add native conditional-format rules highlighting the values above the region's thresholds.
+
+        One rule per metric and run of adjacent columns over the rows of the region block, so Excel re-evaluates
+        them when a value is edited. Blank cells are never highlighted.
+
+        Parameters:
+        - ws: Worksheet object
+        - col_order_ls: Columns of the sheet
+        - condition: Thresholds of the region
+        - first_row: First data row (0-based) of the region block
+        - last_row: Last data row (0-based) of the region block
+        - fmt_cache: Formats of the workbook
         """
-        if len(ticker_list) == 0:
-            return gap_ptr
-
-        # Define column lists for different metrics
-        col_dict = {
-            "div": [sheet_df.columns.get_loc(c_text.DIV_YIELD_TTM)],
-            "capex": [
-                sheet_df.columns.get_loc(c_text.CAPEX_NI_TTM),
-                sheet_df.columns.get_loc(c_text.CAPEX_NI_5Y_AVG),
-                sheet_df.columns.get_loc(c_text.CAPEX_NI_10Y_AVG)
-            ],
-            "eps": [
-                sheet_df.columns.get_loc(c_text.EPS_CAGR_TTM),
-                sheet_df.columns.get_loc(c_text.EPS_CAGR_3Y_TTM),
-                sheet_df.columns.get_loc(c_text.EPS_CAGR_5Y_TTM),
-                sheet_df.columns.get_loc(c_text.EPS_CAGR_10Y_TTM)
-            ],
-            "gm": [
-                sheet_df.columns.get_loc(c_text.GM_LAST_Q),
-                sheet_df.columns.get_loc(c_text.GM_TTM),
-                sheet_df.columns.get_loc(c_text.GM_FY1),
-                sheet_df.columns.get_loc(c_text.GM_FY3)
-            ]
-        }
-
-        # Define colors for each metric
-        fill_colors = {
-            "div": "FDE9D9",
-            "capex": "DAEEF3",
-            "eps": "E4DFEC",
-            "gm": "C5D9F1"
-        }
-
-        # Loop through each row based on tickers in the country
-        for row in range(gap_ptr + 1, gap_ptr + len(ticker_list) + 1):
-            for metric, cols in col_dict.items():
-                for col in cols:
-                    cell = ws.cell(row=row, column=col + 1)
-                    if cell.value is None:
-                        continue
-                    if cell.value > getattr(fmt_condition[country_label], metric):
-                        cell.fill = PatternFill(start_color=fill_colors[metric], end_color=fill_colors[metric], fill_type="solid")
-
-        return gap_ptr + len(ticker_list)
-    
+        if last_row < first_row:
+            return
+
+        for metric, col_ls in COND_COL_DICT.items():
+            col_idx_ls = sorted(col_order_ls.index(col) for col in col_ls if col in col_order_ls)
+
+            # Plain float in the formula, a numpy scalar repr or inf / nan is not a valid Excel number
+            threshold = float(getattr(condition, metric))
+            if not math.isfinite(threshold):
+                continue
+
+            fill_fmt = fmt_cache.get_dxf(bg_color=FILL_COLOR_DICT[metric])
+
+            # Runs of adjacent columns
+            run_ls = []
+            for col_idx in col_idx_ls:
+                if len(run_ls) > 0 and run_ls[-1][1] == col_idx - 1:
+                    run_ls[-1][1] = col_idx
+                else:
+                    run_ls.append([col_idx, col_idx])
+
+            for first_col, last_col in run_ls:
+                # Relative to the top-left cell of the range
+                top_left = xl_rowcol_to_cell(first_row, first_col)
+                ws.conditional_format(first_row, first_col, last_row, last_col, {
+                    'type': 'formula',
+                    'criteria': f'=AND(ISNUMBER({top_left}),{top_left}>{threshold!r})',
+                    'format': fill_fmt,
+                })
+
+    @classmethod
+    def write_header(cls, ws, row, col_order_ls, label, fmt_cache: FormatCache):
+        header_fmt = fmt_cache.get(bold=True, text_wrap=True, align='center', valign='vcenter',
+                                   bg_color=HEADER_COLOR, border=1)
+
+        ws.set_row(row, 80.0)
+        ws.write_row(row, 0, col_order_ls, header_fmt)
+        ws.write_string(row, 0, label, header_fmt)  # The region label replaces the first column name
+
+        return row + 1
+
+    @classmethod
+    def write_block(cls, ws, row, block_rows, props_ls, fmt_cache: FormatCache):
+        """Write the rows (tuples of cell values) of a region block from `row`, return the row after the block."""
+        fmt_ls = [fmt_cache.get(**props) for props in props_ls]
+
+        for values in block_rows:
+            for col_idx, val in enumerate(values):
+                if val is None or (isinstance(val, float) and val != val):
+                    ws.write_blank(row, col_idx, None, fmt_ls[col_idx])
+                elif isinstance(val, str):
+                    ws.write_string(row, col_idx, val, fmt_ls[col_idx])
+                else:
+                    ws.write_number(row, col_idx, val, fmt_ls[col_idx])
+
+            row += 1
+
+        return row
+
     @classmethod
-    def insert_conditional_table(cls, ws, to_insert_row, region_label, fmt_condition, border_style, c_text):
+    def insert_conditional_table(cls, ws, to_insert_row, region_label, fmt_condition, fmt_cache: FormatCache,
+                                 merge=True):
         """
-        Inserts a conditional formatting table into the worksheet for a given region.
-        
+        Inserts the thresholds table of a region below the data.
+
         Parameters:
         - ws: Worksheet object
-        - to_insert_row: Row index where the table starts
+        - to_insert_row: Row index (0-based) after which the table starts
         - region_label: Label for the region (e.g., "US", "CN" or "JP")
         - fmt_condition: Dictionary containing formatted condition values
-        - border_style: Border style to apply
-        - c_text: Object containing text constants
+        - fmt_cache: Formats of the workbook
+        - merge: Merge the Growth label over its 3 rows. A constant memory worksheet only takes cells row by row,
+          there the label is framed on the first row instead
         """
-        
+        border_fmt = fmt_cache.get(border=1)
+        condition = fmt_condition[getattr(c_text, f'LABEL__{region_label}')]
+
         # Insert region header
         to_insert_row += 1
-        cell = ws.cell(row=to_insert_row, column=1)
-        cell.value = getattr(c_text, f'LABEL__{region_label}')
-        
+        ws.write_string(to_insert_row, 0, getattr(c_text, f'LABEL__{region_label}'))
+
         # Insert Condition Value
         to_insert_row += 1
-        value_label_cell = ws.cell(row=to_insert_row, column=1)
-        value_label_cell.value = c_text.COND__VALUE
-        value_label_cell.border = border_style
+        ws.write_string(to_insert_row, 0, c_text.COND__VALUE, border_fmt)
+        ws.write_string(to_insert_row, 1, f'{c_text.COND__DIV} {condition.div}', border_fmt)
 
-        div_cell = ws.cell(row=to_insert_row, column=2)
-        div_cell.value = f"{c_text.COND__DIV} {fmt_condition[getattr(c_text, f'LABEL__{region_label}')].div}"
-        div_cell.border = border_style
-
-        # Insert Condition Growth
+        # Insert Condition Growth, EPS and GM with the merged Growth label
         to_insert_row += 1
-        growth_label_cell = ws.cell(row=to_insert_row, column=1)
-        growth_label_cell.value = c_text.COND__GROWTH
-        growth_label_cell.border = border_style
+        if merge:
+            ws.merge_range(to_insert_row, 0, to_insert_row + 2, 0, c_text.COND__GROWTH,
+                           fmt_cache.get(border=1, valign='vcenter'))
+        else:
+            ws.write_string(to_insert_row, 0, c_text.COND__GROWTH, fmt_cache.get(left=1, right=1, top=1))
+        ws.write_string(to_insert_row, 1, f'{c_text.COND__CAPEX} {condition.capex}', border_fmt)
 
-        capex_cell = ws.cell(row=to_insert_row, column=2)
-        capex_cell.value = f"{c_text.COND__CAPEX} {fmt_condition[getattr(c_text, f'LABEL__{region_label}')].capex}"
-        capex_cell.border = border_style
+        if not merge:
+            ws.write_blank(to_insert_row + 1, 0, None, fmt_cache.get(left=1, right=1))
+        ws.write_string(to_insert_row + 1, 1, f'{c_text.COND__EPS} {condition.eps}', border_fmt)
 
-        # Insert Condition EPS
-        to_insert_row += 1
-        eps_cell = ws.cell(row=to_insert_row, column=2)
-        eps_cell.value = f"{c_text.COND__EPS} {fmt_condition[getattr(c_text, f'LABEL__{region_label}')].eps}"
-        eps_cell.border = border_style
+        if not merge:
+            ws.write_blank(to_insert_row + 2, 0, None, fmt_cache.get(left=1, right=1, bottom=1))
+        ws.write_string(to_insert_row + 2, 1, f'{c_text.COND__GM} {condition.gm}', border_fmt)
 
-        # Insert Condition GM
-        to_insert_row += 1
-        gm_cell = ws.cell(row=to_insert_row, column=2)
-        gm_cell.value = f"{c_text.COND__GM} {fmt_condition[getattr(c_text, f'LABEL__{region_label}')].gm}"
-        gm_cell.border = border_style
+        return to_insert_row + 3
+
+    @classmethod
+    def write_sheet(cls, ws, get_block_rows, sheetname, data_container: DataContainer,
+                    fmt_condition: Dict[str, ConditionContainer], fmt_cache: FormatCache, merge=True):
+        """
+        Write a sheet top to bottom, every row once and in order.
+
+        Parameters:
+        - ws: Worksheet object
+        - get_block_rows: (ticker_ls, col_order_ls) -> rows of the region block, tuples of cell values
+        - sheetname: Name of the sheet
+        - data_container: Tickers of the sheet by region
+        - fmt_condition: Dictionary containing formatted condition values
+        - fmt_cache: Formats of the workbook
+        - merge: Merge cells of the condition tables, see `insert_conditional_table`
+        """
+        is_value_sheet = (sheetname == c_text.LABEL__VALUE_STOCK)
+        col_order_ls = LayoutOutputData.col_value_order if is_value_sheet else LayoutOutputData.col_order
+        props_ls = cls.get_column_props(col_order_ls)
+
+        # White background
+        ws.hide_gridlines(2)
+
+        # Set column default width, then specific width
+        ws.set_column(0, len(col_order_ls) - 1, 9.0)
+        ws.set_column(0, 2, 20)
+        for dt_col in DT_COL_LS:
+            col_idx = col_order_ls.index(dt_col)
+            ws.set_column(col_idx, col_idx, 11.5)
+
+        # One block per region, each under a copy of the header renamed to the region, a blank row in between
+        term = sheetname.split(' ')[0]
+        row = 0
+        for region_code, region_label, attr in REGION_LS:
+            ticker_ls = getattr(data_container, attr)
+            if len(ticker_ls) == 0:
+                continue
+
+            if row > 0:
+                row += 1
+
+            first_row = cls.write_header(ws, row, col_order_ls, f'{region_label} {term}', fmt_cache)
+            row = cls.write_block(ws, first_row, get_block_rows(ticker_ls, col_order_ls), props_ls, fmt_cache)
+
+            # Conditional formatting
+            cls.apply_conditional_formatting(ws, col_order_ls, fmt_condition[region_label], first_row, row - 1,
+                                             fmt_cache)
 
-        # Merge Growth label cell
-        ws.merge_cells(f"A{to_insert_row - 2}:A{to_insert_row}")
-        growth_label_cell.alignment = Alignment(vertical='center')
+        # Insert the conditional formatting table
+        to_insert_row = row + 2
+        ws.write_string(to_insert_row, 0, c_text.COND, fmt_cache.get(bold=True, bg_color=COND_HEADER_COLOR))
+        ws.write_blank(to_insert_row, 1, None, fmt_cache.get(bg_color=COND_HEADER_COLOR))
 
-        return to_insert_row + 1
+        for region_code, region_label, attr in REGION_LS:
+            if len(getattr(data_container, attr)) > 0:
+                to_insert_row = cls.insert_conditional_table(ws, to_insert_row, region_code, fmt_condition, fmt_cache,
+                                                             merge=merge)
 
     @classmethod
     def convert_df_to_excel(self, df: pd.DataFrame, data_layout_dict: Dict[str, DataContainer], fmt_condition: Dict[str, ConditionContainer]):
+        """
+        Formatted workbook of the sheets in a single xlsxwriter pass: every cell is written once with its final
+        style, region blocks and condition tables included.
+
+        Returns:
+            bytes: The xlsx file.
+        """
         output = BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter')
+        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        fmt_cache = FormatCache(workbook)
 
-        unique_df: pd.DataFrame = df.copy().set_index('Ticker')
-        unique_df.drop_duplicates(inplace=True)
+        unique_df: pd.DataFrame = df.set_index('Ticker')
+        unique_df = unique_df[~unique_df.index.duplicated()]
 
-        border_style = Border(
-            left=Side(style="thin"),
-            right=Side(style="thin"),
-            top=Side(style="thin"),
-            bottom=Side(style="thin"),
-        )
+        def _get_block_rows(ticker_ls, col_order_ls):
+            return unique_df.loc[ticker_ls].reset_index()[col_order_ls].itertuples(index=False, name=None)
 
         for sheetname, data_container in data_layout_dict.items():
-            is_value_sheet = (sheetname == c_text.LABEL__VALUE_STOCK)
-
             # If sheet no content, skip
             if data_container.is_empty():
                 continue
 
-            sheet_df_ls = []
-            if len(data_container.us_ticker_ls) > 0:
-                sheet_df_ls.append(unique_df.loc[data_container.us_ticker_ls].reset_index())
-            
-            if len(data_container.cn_ticker_ls) > 0:
-                sheet_df_ls.append(unique_df.loc[data_container.cn_ticker_ls].reset_index())
-            
-            if len(data_container.jp_ticker_ls) > 0:
-                sheet_df_ls.append(unique_df.loc[data_container.jp_ticker_ls].reset_index())
-            
-            sheet_df = pd.concat(sheet_df_ls)
-            sheet_df.reset_index(drop=True, inplace=True)
-
-            # If is value stock, reorder the columns
-            if is_value_sheet:
-                sheet_df = sheet_df[LayoutOutputData.col_value_order]
-            else:
-                sheet_df = sheet_df[LayoutOutputData.col_order]
-
-            sheet_df.to_excel(writer, sheet_name=sheetname, index=False)
-            
-            # Access the workbook and worksheet
-            workbook = writer.book
-            worksheet = writer.sheets[sheetname]
-
-            percent_format = workbook.add_format({'num_format': '0.0%'})
-            one_decimal_format = workbook.add_format({'num_format': '#,##0.0'})
-            three_decimal_format = workbook.add_format({'num_format': '#,##0.000'})
-            
-            if LayoutOutputDataFormat.pct_col_ls:
-                for col in LayoutOutputDataFormat.pct_col_ls:
-                    if col in sheet_df.columns:
-                        col_idx = sheet_df.columns.get_loc(col)
-                        worksheet.set_column(col_idx, col_idx, None, percent_format)
-
-            if LayoutOutputDataFormat.num_one_decim_col_ls:
-                for col in LayoutOutputDataFormat.num_one_decim_col_ls:
-                    if col in sheet_df.columns:
-                        col_idx = sheet_df.columns.get_loc(col)
-                        worksheet.set_column(col_idx, col_idx, None, one_decimal_format)
-
-            if LayoutOutputDataFormat.num_three_decim_col_ls:
-                for col in LayoutOutputDataFormat.num_three_decim_col_ls:
-                    if col in sheet_df.columns:
-                        col_idx = sheet_df.columns.get_loc(col)
-                        worksheet.set_column(col_idx, col_idx, None, three_decimal_format)
-
-        writer.close()
-
-        # More customise formatting
-        output.seek(0)
-        wb = load_workbook(output)
-        for sheetname, data_container in data_layout_dict.items():
-            is_value_sheet = (sheetname == c_text.LABEL__VALUE_STOCK)
-            col_order_ls = LayoutOutputData.col_value_order if is_value_sheet else LayoutOutputData.col_order
+            self.write_sheet(workbook.add_worksheet(sheetname), _get_block_rows, sheetname, data_container,
+                             fmt_condition, fmt_cache)
+
+        workbook.close()
+
+        # Get processed data
+        return output.getvalue()
+
+    @classmethod
+    def stream_df_to_excel(cls, output, df: pd.DataFrame, data_layout_dict: Dict[str, DataContainer],
+                           fmt_condition: Dict[str, ConditionContainer], format_fn=None,
+                           chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Formatted workbook of the sheets streamed to a file or stream, for universes too large for
+        `convert_df_to_excel`.
+
+        Worksheets run in constant memory mode: each row is flushed to a temporary file once the next one is
+        written, and region blocks are sliced from `df` (and formatted) `chunk_size` rows at a time. Besides `df`
+        itself, memory use does not grow with the number of tickers. The Growth label of the condition tables is
+        not merged, see `insert_conditional_table`.
+
+        Parameters:
+        - output: Path of the xlsx file, or a writable binary stream
+        - df: Raw output table, one row per ticker
+        - data_layout_dict: Tickers of each sheet by region
+        - fmt_condition: Dictionary containing formatted condition values
+        - format_fn: Formats a slice of `df` for display, e.g. huge numbers to K, M, B
+        - chunk_size: Rows of a region block sliced at once
+        """
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        fmt_cache = FormatCache(workbook)
+
+        # Position of the first row of each ticker
+        pos_dict = {}
+        for pos, ticker in enumerate(df['Ticker']):
+            pos_dict.setdefault(ticker, pos)
+
+        def _get_block_rows(ticker_ls, col_order_ls):
+            for i in range(0, len(ticker_ls), chunk_size):
+                chunk_df = df.iloc[[pos_dict[ticker] for ticker in ticker_ls[i:i + chunk_size]]]
+                if format_fn is not None:
+                    chunk_df = format_fn(chunk_df)
+
+                yield from chunk_df[col_order_ls].itertuples(index=False, name=None)
 
+        for sheetname, data_container in data_layout_dict.items():
+            # If sheet no content, skip
             if data_container.is_empty():
                 continue
 
-            ws = wb[sheetname]
-
-            # Set the sheet_df back with the values in excel
-            sheet_df = pd.DataFrame(ws.values)
-            sheet_df.columns = sheet_df.iloc[0]  # Set first row as column names
-            sheet_df = sheet_df[1:]
-
-            # Pre-fill white content
-            for row in ws.iter_rows(min_row=1, max_row=2_000, min_col=1, max_col=100):
-                for cell in row:
-                    cell.fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-            # Total column length
-            tot_col_len = len(col_order_ls)
-
-            # Apply the border to all used cells
-            for row in ws.iter_rows(min_row=1, max_row=len(data_container.master_ticker_ls) + 1, min_col=1, max_col=tot_col_len):
-                for cell in row:
-                    cell.border = border_style
-
-            # Header
-            header_row = 1
-            header_col = 1
-
-            for row in ws.iter_rows(min_row=1, max_row=1, min_col=1, max_col=tot_col_len):
-                for cell in row:
-                    cell.alignment = Alignment(wrap_text=True, horizontal='center', vertical='center')
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-
-            # Set column default width
-            for c in range(1, tot_col_len + 1):
-                col_letter = get_column_letter(c)
-                ws.column_dimensions[col_letter].width = 9.0
-
-            # Specific width
-            ws.column_dimensions[get_column_letter(1)].width = 20
-            ws.column_dimensions[get_column_letter(2)].width = 20
-            ws.column_dimensions[get_column_letter(3)].width = 20
-            dt_col_ls = [c_text.NEXT_EARN_DATE, c_text.BEAT_EST_LAST_UPDATE, c_text.LAST_EX_DIV_DT]
-            for dt_col in dt_col_ls:
-                ws.column_dimensions[get_column_letter(sheet_df.columns.get_loc(dt_col) + 1)].width = 11.5
-            
-            ws.row_dimensions[1].height = 80.0
-
-            # Alignment
-            center_align_ls = [sheet_df.columns.get_loc(c) for c in dt_col_ls + [c_text.CCY]]
-            for col in center_align_ls:
-                col += 1
-                for row in range(2, len(data_container.master_ticker_ls) + 2):
-                    cell = ws.cell(row=row, column=col)
-                    cell.alignment = Alignment(wrap_text=True, horizontal='center')
-            
-            right_align_ls = LayoutOutputDataFormat.txt_col_ls.copy()
-            right_align_ls = list(filter(lambda x: x in col_order_ls, right_align_ls))
-            right_align_ls = [sheet_df.columns.get_loc(c) for c in right_align_ls]
-            for col in right_align_ls:
-                col += 1
-                for row in range(2, len(data_container.master_ticker_ls) + 2):
-                    cell = ws.cell(row=row, column=col)
-                    cell.alignment = Alignment(wrap_text=True, horizontal='right')
-            
-            # Copy and paste the header and rename it
-            out_header_ls = []
-            term = sheetname.split(' ')[0]
-            
-            if len(data_container.us_ticker_ls) > 0:
-                out_header_ls.append([f'{c_text.LABEL__US} {term}', len(data_container.us_ticker_ls)])
-            if len(data_container.cn_ticker_ls) > 0:
-                out_header_ls.append([f'{c_text.LABEL__CN} {term}', len(data_container.cn_ticker_ls)])
-            if len(data_container.jp_ticker_ls) > 0:
-                out_header_ls.append([f'{c_text.LABEL__JP} {term}', len(data_container.jp_ticker_ls)])
+            cls.write_sheet(workbook.add_worksheet(sheetname), _get_block_rows, sheetname, data_container,
+                            fmt_condition, fmt_cache, merge=False)
 
-            # Conditional formatting
-            gap_ptr = 1
-            gap_ptr = self.apply_conditional_formatting(ws, fmt_condition, sheet_df, c_text.LABEL__US, data_container.us_ticker_ls, gap_ptr)
-            gap_ptr = self.apply_conditional_formatting(ws, fmt_condition, sheet_df, c_text.LABEL__CN, data_container.cn_ticker_ls, gap_ptr)
-            gap_ptr = self.apply_conditional_formatting(ws, fmt_condition, sheet_df, c_text.LABEL__JP, data_container.jp_ticker_ls, gap_ptr)
-
-            # Insert the header to rest of the country
-            to_insert_row = 0
-            for i, (label, tot_len) in enumerate(out_header_ls):
-                if i == 0:
-                    header_cell = ws.cell(row=header_row, column=header_col)
-                    header_cell.value = label
-                    to_insert_row += tot_len + 2
-                
-                    continue
-                
-                # Insert breaker
-                ws.insert_rows(to_insert_row, 2)
-
-                # Fill up empty cells
-                for row in ws.iter_rows(min_row=to_insert_row, max_row=to_insert_row, min_col=1, max_col=100):
-                    for cell in row:
-                        cell.fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-                to_insert_row += 1  # Move the header pointer
-
-                # Add the new header to each group and copy the header from row 1
-                for col in range(1, ws.max_column + 1):
-                    cell_source = ws.cell(row=header_row, column=col)
-                    cell_target = ws.cell(row=to_insert_row, column=col)
-
-                    cell_target.value = cell_source.value
-
-                    if cell_source.has_style:
-                        cell_target.font = Font(
-                            name=cell_source.font.name,
-                            size=cell_source.font.size,
-                            bold=cell_source.font.bold,
-                            italic=cell_source.font.italic,
-                            underline=cell_source.font.underline,
-                            color=cell_source.font.color
-                        )
-
-                        cell_target.fill = PatternFill(
-                            fill_type=cell_source.fill.fill_type,
-                            start_color=cell_source.fill.start_color,
-                            end_color=cell_source.fill.end_color
-                        )
-
-                        cell_target.border = Border(
-                            left=cell_source.border.left,
-                            right=cell_source.border.right,
-                            top=cell_source.border.top,
-                            bottom=cell_source.border.bottom
-                        )
-
-                        cell_target.alignment = Alignment(
-                            horizontal=cell_source.alignment.horizontal,
-                            vertical=cell_source.alignment.vertical,
-                            wrap_text=cell_source.alignment.wrap_text
-                        )
-
-                        cell_target.number_format = cell_source.number_format
-                    
-                    ws.row_dimensions[to_insert_row].height = ws.row_dimensions[header_row].height
-
-                    header_cell = ws.cell(row=to_insert_row, column=header_col)
-                    header_cell.value = label
-                
-                to_insert_row += tot_len + 1
-
-            # Insert the conditional formatting table
-            to_insert_row += 2
-            cond_cell_header = ws.cell(row=to_insert_row, column=1)
-            cond_cell_header.value = c_text.COND
-            cond_cell_header.fill = PatternFill(start_color='DAEEF3', end_color='DAEEF3', fill_type="solid")
-            cond_cell_header.font = Font(bold=True)
-            
-            next_cond_cell_header = ws.cell(row=to_insert_row, column=2)
-            next_cond_cell_header.fill = PatternFill(start_color='DAEEF3', end_color='DAEEF3', fill_type="solid")
-
-            if len(data_container.us_ticker_ls) > 0:
-                to_insert_row = self.insert_conditional_table(ws, to_insert_row, "US", fmt_condition, border_style, c_text)
-
-            if len(data_container.cn_ticker_ls) > 0:
-                to_insert_row = self.insert_conditional_table(ws, to_insert_row, "CN", fmt_condition, border_style, c_text)
-
-            if len(data_container.jp_ticker_ls) > 0:
-                to_insert_row = self.insert_conditional_table(ws, to_insert_row, "JP", fmt_condition, border_style, c_text)
-        
-                
-        # Save the modified Excel file back to BytesIO
-        final_output = BytesIO()
-        wb.save(final_output)
-
-        # Get processed data
-        processed_data = final_output.getvalue()
- 
-        return processed_data
-    
\ No newline at end of file
+        workbook.close()
@@ -0,0 +1,94 @@
+import random
+
+from main.constants import c_api_text
+from main.constants.c_fin_key import (
+    ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL, EARNINGS_CAL,
+)
+
+INCOME_FIELD_DICT = {c_api_text.FMP_REV: (-10, 1000), c_api_text.FMP_NI: (-100, 100), c_api_text.FMP_GP: (0, 500),
+                     c_api_text.FMP_EBIT: (-50, 200)}
+BALANCE_FIELD_DICT = {c_api_text.FMP_TOT_EQ: (-100, 1000), c_api_text.FMP_NET_DEBT: (-50, 50),
+                      c_api_text.FMP_TOT_DEBT: (0, 100), c_api_text.FMP_CNC: (0, 100)}
+CF_FIELD_DICT = {c_api_text.FMP_CAPEX: (-100, 0), c_api_text.FMP_AR: (0, 50), c_api_text.FMP_INV: (0, 50)}
+RATIO_FIELD_DICT = {c_api_text.FMP_GPM: (0, 1), c_api_text.FMP_EFF_TAX_R: (0, 0.4)}
+RATIO_TTM_FIELD_DICT = {c_api_text.FMP_DIV_TTM: (0, 0.1), c_api_text.FMP_PE_TTM: (-20, 80),
+                        c_api_text.FMP_PEG_TTM: (-2, 5), c_api_text.FMP_DIV_PR_TTM: (0, 1)}
+
+
+def quarter_date(i):
+    """End of the `i`-th quarter before 2025 Q4, negative for upcoming quarters."""
+    year, quarter = divmod(2025 * 4 + 3 - i, 4)
+    return f'{year}-{3 * quarter + 3:02d}-28'
+
+
+def gen_financials(n_ticker, seed=0, null_rate=0.0):
+    """
+    Random `data_raw_financials` of plain dict rows, newest first, as FMP returns them.
+
+    Statements have random depths (some empty or not fetched), values are sometimes 0 and, with `null_rate`,
+    sometimes null. Earnings calendars start with upcoming rows holding estimates only.
+    """
+    rng = random.Random(seed)
+
+    def num(lo, hi, allow_zero=True, allow_null=True):
+        if allow_null and rng.random() < null_rate:
+            return None
+        if allow_zero and rng.random() < 0.03:
+            return 0
+
+        return rng.uniform(lo, hi)
+
+    def depth(max_depth):
+        x = rng.random()
+        return 0 if x < 0.05 else (rng.randint(1, max_depth) if x < 0.3 else max_depth)
+
+    def statement(n_row, field_dict, is_annual):
+        rows = []
+        for i in range(n_row):
+            date = f'{2025 - i}-12-31' if is_annual else quarter_date(i)
+            rows.append({c_api_text.FMP_DT: date, **{f: num(lo, hi) for f, (lo, hi) in field_dict.items()}})
+
+        return rows
+
+    data = {}
+    for t in range(n_ticker):
+        fin_dict = {
+            ANN_INCOME: statement(depth(10), INCOME_FIELD_DICT, True),
+            QUAR_INCOME: statement(depth(10), INCOME_FIELD_DICT, False),
+            ANN_BALANCE: statement(depth(10), BALANCE_FIELD_DICT, True),
+            QUAR_BALANCE: statement(depth(10), BALANCE_FIELD_DICT, False),
+            ANN_CF: statement(depth(10), CF_FIELD_DICT, True),
+            QUAR_CF: statement(depth(10), CF_FIELD_DICT, False),
+            ANN_RATIO: statement(depth(10), RATIO_FIELD_DICT, True),
+            QUAR_RATIO: statement(depth(10), RATIO_FIELD_DICT, False),
+            RATIO_TTM: statement(rng.choice([0, 1, 1, 1]), RATIO_TTM_FIELD_DICT, True),
+        }
+
+        div_rows = statement(depth(10), {c_api_text.FMP_DIV: (0, 2)}, False)
+        for i, row in enumerate(div_rows):
+            row[c_api_text.FMP_RECORD_DT] = f'2025-0{1 + i % 9}-15'
+        fin_dict[DIV_CAL] = div_rows
+
+        # Upcoming rows hold estimates only, then rows with actuals
+        n_act = rng.choice([0, 3, 9, 15, 25, 45, 46])
+        n_upcoming = rng.randint(0, 4) if n_act > 0 else 0
+        earnings_rows = []
+        for i in range(n_upcoming + n_act):
+            is_upcoming = i < n_upcoming
+            earnings_rows.append({
+                c_api_text.FMP_DT: quarter_date(i - n_upcoming),
+                c_api_text.FMP_EPS_EST: num(-2, 5),
+                c_api_text.FMP_REV_EST: num(1, 100, allow_zero=False, allow_null=False),
+                c_api_text.FMP_EPS_ACT: None if is_upcoming else num(-2, 5),
+                c_api_text.FMP_REV_ACT: None if is_upcoming else num(1, 100, allow_zero=False, allow_null=False),
+            })
+        fin_dict[EARNINGS_CAL] = earnings_rows
+
+        # A failed fetch
+        if rng.random() < 0.05:
+            del fin_dict[rng.choice(list(fin_dict))]
+
+        data[f'T{t}'] = fin_dict
+
+    return data
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from main.util.async_fetch import run_concurrently
+
+
+def test_run_concurrently_keeps_call_order():
+    calls = {i: (lambda i=i: i * i) for i in range(20)}
+    done_ls = []
+
+    result = run_concurrently(calls, max_concurrency=4, on_done=lambda key, res: done_ls.append(key))
+
+    assert list(result.items()) == [(i, i * i) for i in range(20)]
+    assert sorted(done_ls) == list(range(20))
+
+
+def test_run_concurrently_inside_running_loop():
+    calls = {i: (lambda i=i: i + 1) for i in range(10)}
+    caller_thread = threading.get_ident()
+    on_done_thread_set = set()
+
+    async def _main():
+        return run_concurrently(calls, max_concurrency=3,
+                                on_done=lambda key, res: on_done_thread_set.add(threading.get_ident()))
+
+    assert asyncio.run(_main()) == {i: i + 1 for i in range(10)}
+    assert on_done_thread_set == {caller_thread}
+
+
+def test_run_concurrently_empty():
+    assert run_concurrently({}) == {}
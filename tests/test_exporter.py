@@ -0,0 +1,69 @@
+import json
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from main.constants import c_text
+from main.data.data_container import DataContainer
+from main.util.exporter import Exporter
+
+
+def _data_layout_dict():
+    data_container = DataContainer()
+    data_container.input_ticker__us = 'AAA, BBB'
+    data_container.input_ticker__jp = 'CCC'
+    data_container.batch_process_ticker()
+
+    return {c_text.LABEL__WATCHLIST_STOCK: data_container}
+
+
+def test_missing_text_values_are_null():
+    raw_data_df = pd.DataFrame({
+        c_text.TICKER: ['AAA', 'BBB', 'CCC'],
+        c_text.NEXT_EARN_DATE: pd.Series(['2025-10-28', None, float('nan')], dtype=object),
+        c_text.NI_TTM: [1.5, None, 3.0],
+    })
+
+    table_df = Exporter.to_table(raw_data_df, _data_layout_dict())
+    assert table_df[c_text.NEXT_EARN_DATE].isna().tolist() == [False, True, True]
+    assert table_df[c_text.REGION].tolist() == [c_text.LABEL__US, c_text.LABEL__US, c_text.LABEL__JP]
+
+    output = BytesIO()
+    Exporter.write(table_df, output, 'arrow')
+    table = pa.ipc.open_file(pa.BufferReader(output.getvalue())).read_all()
+    date_type = table.schema.field(c_text.NEXT_EARN_DATE).type
+    assert pa.types.is_string(date_type) or pa.types.is_large_string(date_type)
+    assert table[c_text.NEXT_EARN_DATE].to_pylist() == ['2025-10-28', None, None]
+
+    output = BytesIO()
+    Exporter.write(table_df, output, 'jsonl')
+    row_ls = [json.loads(line) for line in output.getvalue().decode().splitlines()]
+    assert [row[c_text.NEXT_EARN_DATE] for row in row_ls] == ['2025-10-28', None, None]
+
+
+def test_all_missing_columns_keep_their_type():
+    raw_data_df = pd.DataFrame({
+        c_text.TICKER: ['AAA', 'BBB', 'CCC'],
+        c_text.NEXT_EARN_DATE: [None, None, None],
+        c_text.NI_TTM: [None, None, None],
+        c_text.PEG_R_TTM: pd.Series([1, None, '2.5'], dtype=object),
+    })
+
+    table_df = Exporter.to_table(raw_data_df, _data_layout_dict())
+    assert table_df[c_text.NI_TTM].dtype == 'float64'
+    assert table_df[c_text.PEG_R_TTM].tolist()[::2] == [1.0, 2.5]
+
+    for fmt in ('parquet', 'arrow'):
+        output = BytesIO()
+        Exporter.write(table_df, output, fmt)
+        if fmt == 'parquet':
+            schema = pq.read_schema(pa.BufferReader(output.getvalue()))
+        else:
+            schema = pa.ipc.open_file(pa.BufferReader(output.getvalue())).schema
+
+        assert schema.field(c_text.NI_TTM).type == pa.float64()
+        assert schema.field(c_text.PEG_R_TTM).type == pa.float64()
+        date_type = schema.field(c_text.NEXT_EARN_DATE).type
+        assert pa.types.is_string(date_type) or pa.types.is_large_string(date_type)
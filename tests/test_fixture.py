@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from main.constants.c_fin_key import ANN_INCOME
+from main.util import cache, fetch, fixture, fmp
+from main.util.fixture import MODE_LIVE, MODE_RECORD, MODE_REPLAY, LatencyModel, set_fetch_mode
+
+ROW_LS = [
+    {'date': '2024-12-31', 'revenue': 100.0, 'eps': 1.5, 'unusedField': 'dropped'},
+    {'date': '2023-12-31', 'revenue': 90.0, 'eps': None},
+]
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setenv('FMP_KEY', 'secret')
+    monkeypatch.setattr(cache, '_cache', cache.ResponseCache(str(tmp_path / 'cache.sqlite3')))
+    yield tmp_path
+    set_fetch_mode(MODE_LIVE)
+
+
+def test_replay_serves_recorded_responses(stores, monkeypatch):
+    n_download_ls = []
+
+    def _fake_download(url, params=None, headers=None, timeout=10):
+        n_download_ls.append(url)
+        return json.dumps(ROW_LS).encode()
+
+    monkeypatch.setattr(fetch, '_download', _fake_download)
+
+    set_fetch_mode(MODE_RECORD, fixture_path=str(stores / 'fixtures.sqlite3'))
+    recorded = fmp.fetch_statement('AAA', ANN_INCOME, 2)
+    assert len(n_download_ls) == 1
+
+    # The API key is not part of the recorded key
+    assert all('secret' not in key for key in fixture.get_fixture_store().keys())
+
+    def _no_download(*args, **kwargs):
+        raise AssertionError('replay must not download')
+
+    monkeypatch.setattr(fetch, '_download', _no_download)
+
+    set_fetch_mode(MODE_REPLAY, fixture_path=str(stores / 'fixtures.sqlite3'))
+    replayed = fmp.fetch_statement('AAA', ANN_INCOME, 2)
+
+    assert replayed == recorded
+    assert replayed[0].get('revenue') == 100.0
+    assert 'unusedField' not in replayed[0]
+
+    # Requests never recorded are missing, not fetched
+    assert fmp.fetch_statement('BBB', ANN_INCOME, 2) is None
+
+
+def test_latency_model_is_deterministic():
+    latency = LatencyModel('uniform:0.02,0.2', seed=7)
+
+    assert latency.sample('key') == LatencyModel('uniform:0.02,0.2', seed=7).sample('key')
+    assert 0.02 <= latency.sample('key') <= 0.2
+    assert LatencyModel('0.05').sample('any') == 0.05
+
+    with pytest.raises(ValueError):
+        LatencyModel('gamma:1,2')
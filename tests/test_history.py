@@ -0,0 +1,88 @@
+from main.constants import c_api_text
+from main.constants.c_fin_key import ANN_INCOME, EARNINGS_CAL
+from main.util import fmp, history
+from main.util.history import StatementHistory, merge_rows
+
+
+def _row(date, **fields):
+    return {c_api_text.FMP_DT: date, **fields}
+
+
+def _dates(rows):
+    return [row[c_api_text.FMP_DT] for row in rows]
+
+
+def test_merge_rows_appends_new_periods():
+    history_rows = [_row('2023-12-31', revenue=3), _row('2022-12-31', revenue=2), _row('2021-12-31', revenue=1)]
+    recent_rows = [_row('2024-12-31', revenue=4), _row('2023-12-31', revenue=3)]
+
+    merged_rows, is_full_fetch_needed = merge_rows(ANN_INCOME, history_rows, recent_rows)
+
+    assert not is_full_fetch_needed
+    assert _dates(merged_rows) == ['2024-12-31', '2023-12-31', '2022-12-31', '2021-12-31']
+
+
+def test_merge_rows_caps_at_limit_newest_first():
+    history_rows = [_row('2023-12-31', revenue=3), _row('2022-12-31', revenue=2), _row('2021-12-31', revenue=1)]
+    recent_rows = [_row('2024-12-31', revenue=4), _row('2023-12-31', revenue=3)]
+
+    merged_rows, is_full_fetch_needed = merge_rows(ANN_INCOME, history_rows, recent_rows, limit=3)
+
+    assert not is_full_fetch_needed
+    assert _dates(merged_rows) == ['2024-12-31', '2023-12-31', '2022-12-31']
+    assert _dates(merge_rows(ANN_INCOME, history_rows, [], limit=2)[0]) == ['2023-12-31', '2022-12-31']
+
+
+def test_merge_rows_restatement_needs_full_fetch():
+    history_rows = [_row('2023-12-31', revenue=3), _row('2022-12-31', revenue=2)]
+    recent_rows = [_row('2024-12-31', revenue=4), _row('2023-12-31', revenue=30)]
+
+    merged_rows, is_full_fetch_needed = merge_rows(ANN_INCOME, history_rows, recent_rows)
+
+    assert is_full_fetch_needed
+    assert merged_rows is history_rows
+
+
+def test_merge_rows_missed_periods_need_full_fetch():
+    history_rows = [_row('2021-12-31', revenue=1)]
+    recent_rows = [_row('2024-12-31', revenue=4), _row('2023-12-31', revenue=3)]
+
+    assert merge_rows(ANN_INCOME, history_rows, recent_rows)[1]
+
+
+def test_merge_rows_supersedes_unsettled_rows():
+    # An upcoming earnings date moved from 2024-05-02 to 2024-05-09
+    history_rows = [
+        _row('2024-05-02', epsActual=None, epsEstimated=1.0),
+        _row('2024-02-01', epsActual=0.9, epsEstimated=0.8),
+    ]
+    recent_rows = [
+        _row('2024-05-09', epsActual=None, epsEstimated=1.1),
+        _row('2024-02-01', epsActual=0.9, epsEstimated=0.8),
+    ]
+
+    merged_rows, is_full_fetch_needed = merge_rows(EARNINGS_CAL, history_rows, recent_rows)
+
+    assert not is_full_fetch_needed
+    assert _dates(merged_rows) == ['2024-05-09', '2024-02-01']
+
+
+def test_incremental_fetch_keeps_history_at_limit(tmp_path, monkeypatch):
+    store = StatementHistory(str(tmp_path / 'history.sqlite3'))
+    monkeypatch.setattr(history, '_history', store)
+
+    year_ls = list(range(2024, 2014, -1))
+    store.set('AAA', ANN_INCOME, [_row(f'{y}-12-31', revenue=y) for y in year_ls[1:]], 9)
+
+    def _fake_fetch_statement(ticker, fin_key, limit, refresh=False):
+        return [_row(f'{y}-12-31', revenue=y) for y in year_ls[:limit]]
+
+    monkeypatch.setattr(fmp, 'fetch_statement', _fake_fetch_statement)
+
+    for _ in range(3):
+        rows = fmp.fetch_statement_incremental('AAA', ANN_INCOME, 5)
+        assert _dates(rows) == [f'{y}-12-31' for y in year_ls[:5]]
+
+    stored_rows, depth = store.get('AAA', ANN_INCOME)
+    assert depth == 5
+    assert len(stored_rows) == 5
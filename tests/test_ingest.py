@@ -0,0 +1,38 @@
+from main.util.ingest import Record, project_rows, to_plain
+
+ROW_LS = [
+    {'date': '2024-12-31', 'revenue': 100.0, 'epsActual': 1.5, 'currency': 'USD'},
+    {'date': '2023-12-31', 'revenue': 90.0, 'epsActual': None, 'currency': None},
+    {'date': '2022-12-31', 'revenue': 80.0},
+]
+
+
+def test_project_rows_reads_like_dicts():
+    record_ls = project_rows(ROW_LS)
+
+    assert all(isinstance(r, Record) for r in record_ls)
+    assert record_ls[0].get('revenue') == 100.0
+    assert record_ls[0]['date'] == '2024-12-31'
+    assert 'unusedField' not in record_ls[0]
+
+
+def test_get_returns_default_for_value_missing_from_one_row():
+    record_ls = project_rows(ROW_LS)
+
+    # Numeric field
+    assert record_ls[1].get('epsActual', 0.0) == 0.0
+    assert record_ls[2].get('epsActual', 0.0) == 0.0
+    assert record_ls[1].get('epsActual') is None
+
+    # Text field
+    assert record_ls[1].get('currency', 'N/A') == 'N/A'
+    assert record_ls[0].get('currency', 'N/A') == 'USD'
+
+    # Field of no row
+    assert record_ls[0].get('netIncome', 0.0) == 0.0
+
+
+def test_to_plain_round_trip():
+    record_ls = project_rows(ROW_LS)
+
+    assert project_rows(to_plain(record_ls)) == record_ls
@@ -0,0 +1,196 @@
+import math
+
+import pytest
+
+from main.constants import c_api_text, c_text
+from main.constants.c_fin_key import (
+    ANN_INCOME, QUAR_INCOME, ANN_BALANCE, QUAR_BALANCE, ANN_CF, QUAR_CF,
+    ANN_RATIO, QUAR_RATIO, RATIO_TTM, DIV_CAL, EARNINGS_CAL,
+)
+from main.util.ingest import project_rows
+from main.util.metric_registry import MetricRegistry
+from main.util.metrics_engine import MetricsEngine
+from main.util.statement_store import StatementStore
+from synthetic import gen_financials
+
+
+class ScalarReference:
+    """
+    One ticker at a time over the plain dict rows, the per-ticker formulas the engine replaced:
+    missing rows read as the default, null values as None, sums with a null inside the window are None.
+    """
+
+    def __init__(self, fin_dict):
+        self.fin_dict = {k: v for k, v in fin_dict.items() if isinstance(v, list)}
+
+    def value(self, fin_key, field, idx=0, default_value=0.0):
+        rows = self.fin_dict.get(fin_key, [])
+        if idx >= len(rows):
+            return default_value
+
+        return rows[idx].get(field, default_value)
+
+    def window(self, fin_key, field, n):
+        values = [row.get(field, 0.0) for row in self.fin_dict.get(fin_key, [])[:n]]
+        return None if None in values else sum(values)
+
+    def eps_window(self, beg_n, end_n):
+        reported = [row[c_api_text.FMP_EPS_ACT] for row in self.fin_dict.get(EARNINGS_CAL, [])
+                    if row[c_api_text.FMP_EPS_ACT] is not None]
+        values = reported[beg_n - 1:end_n]
+        return sum(values)
+
+    def earnings(self, field, is_est=True, default_value=0.0):
+        flag_field = c_api_text.FMP_REV_EST if is_est else c_api_text.FMP_REV_ACT
+        for row in self.fin_dict.get(EARNINGS_CAL, []):
+            if row[flag_field] is not None:
+                return row[field]
+
+        return default_value
+
+    @staticmethod
+    def safe_div(n1, n2):
+        if n1 is None or n2 is None or n2 == 0:
+            return None
+
+        return n1 / n2
+
+    @staticmethod
+    def cagr(latest_val, ori_val, period):
+        if latest_val is None or ori_val is None or latest_val == 0 or ori_val == 0:
+            return None
+
+        result = (latest_val / ori_val) ** (1 / period) - 1.0
+        return float(result.real) if isinstance(result, complex) else float(result)
+
+    def metrics(self):
+        v, w, div, cagr = self.value, self.window, self.safe_div, self.cagr
+        A = c_api_text
+
+        eps_ttm = self.eps_window(1, 4)
+        eps_cagr_ttm = cagr(eps_ttm, self.eps_window(5, 8), 1)
+        eps_cagr_3y = cagr(eps_ttm, self.eps_window(9, 12), 3)
+        rev_fy1 = v(ANN_INCOME, A.FMP_REV)
+        ni_ttm = w(QUAR_INCOME, A.FMP_NI, 4)
+        pe_ttm = v(RATIO_TTM, A.FMP_PE_TTM)
+
+        ebit_ttm = w(QUAR_INCOME, A.FMP_EBIT, 4)
+        tax_rate = v(ANN_RATIO, A.FMP_EFF_TAX_R)
+        capital_ls = [v(QUAR_BALANCE, A.FMP_TOT_DEBT), v(QUAR_BALANCE, A.FMP_TOT_EQ), v(QUAR_BALANCE, A.FMP_CNC)]
+        roic = None
+        if ebit_ttm is not None and tax_rate is not None and None not in capital_ls:
+            roic = div(ebit_ttm * (1 - tax_rate), capital_ls[0] + capital_ls[1] - capital_ls[2])
+
+        beat_estimate = div(self.earnings(A.FMP_EPS_ACT, is_est=False), self.earnings(A.FMP_EPS_EST, is_est=False))
+
+        return {
+            c_text.MIND_SHARE: None,
+            c_text.MKT_SHARE: None,
+            c_text.GM_LAST_Q: v(QUAR_RATIO, A.FMP_GPM),
+            c_text.GM_TTM: div(w(QUAR_INCOME, A.FMP_GP, 4), w(QUAR_INCOME, A.FMP_REV, 4)),
+            c_text.GM_FY1: v(ANN_RATIO, A.FMP_GPM, 0, None),
+            c_text.GM_FY3: v(ANN_RATIO, A.FMP_GPM, 2, None),
+            c_text.GM_FY5: v(ANN_RATIO, A.FMP_GPM, 4, None),
+            c_text.GM_FY10: v(ANN_RATIO, A.FMP_GPM, 9, None),
+            c_text.EPS_CAGR_TTM: eps_cagr_ttm,
+            c_text.EPS_CAGR_3Y_TTM: eps_cagr_3y,
+            c_text.EPS_CAGR_5Y_TTM: cagr(eps_ttm, self.eps_window(17, 20), 5),
+            c_text.EPS_CAGR_10Y_TTM: cagr(eps_ttm, self.eps_window(37, 40), 10),
+            c_text.REV_CAGR_1Y: cagr(rev_fy1, v(ANN_INCOME, A.FMP_REV, 1), 1),
+            c_text.REV_CAGR_3Y: cagr(rev_fy1, v(ANN_INCOME, A.FMP_REV, 2), 3),
+            c_text.REV_CAGR_5Y: cagr(rev_fy1, v(ANN_INCOME, A.FMP_REV, 4), 5),
+            c_text.REV_CAGR_10Y: cagr(rev_fy1, v(ANN_INCOME, A.FMP_REV, 9), 10),
+            c_text.ROE_TTM: div(ni_ttm, v(QUAR_BALANCE, A.FMP_TOT_EQ)),
+            c_text.ROE_FY1: div(v(ANN_INCOME, A.FMP_NI), v(ANN_BALANCE, A.FMP_TOT_EQ)),
+            c_text.ROE_FY3: div(v(ANN_INCOME, A.FMP_NI, 2), v(ANN_BALANCE, A.FMP_TOT_EQ, 2)),
+            c_text.ROE_FY5: div(v(ANN_INCOME, A.FMP_NI, 4), v(ANN_BALANCE, A.FMP_TOT_EQ, 4)),
+            c_text.ROE_FY10: div(v(ANN_INCOME, A.FMP_NI, 9), v(ANN_BALANCE, A.FMP_TOT_EQ, 9)),
+            c_text.CAPEX_NI_TTM: div(w(QUAR_CF, A.FMP_CAPEX, 4), ni_ttm),
+            c_text.CAPEX_NI_5Y_AVG: div(w(ANN_CF, A.FMP_CAPEX, 5), w(ANN_INCOME, A.FMP_NI, 5)),
+            c_text.CAPEX_NI_10Y_AVG: div(w(ANN_CF, A.FMP_CAPEX, 10), w(ANN_INCOME, A.FMP_NI, 10)),
+
+            c_text.NDTE_LAST_Q: div(v(QUAR_BALANCE, A.FMP_NET_DEBT), v(ANN_BALANCE, A.FMP_TOT_EQ)),
+            c_text.RR_LAST_FY: div(v(ANN_CF, A.FMP_AR), rev_fy1),
+            c_text.IR_LAST_FY: div(v(ANN_CF, A.FMP_INV), rev_fy1),
+
+            c_text.DIV_YIELD_TTM: v(RATIO_TTM, A.FMP_DIV_TTM),
+            c_text.TRAILING_PE_TTM: pe_ttm,
+            c_text.PEG_R_TTM: v(RATIO_TTM, A.FMP_PEG_TTM),
+            c_text.PEG_R_FY1: div(pe_ttm, eps_cagr_ttm),
+            c_text.PEG_R_FY3: div(pe_ttm, eps_cagr_3y),
+
+            c_text.TOT_REV_LAST_Q: v(QUAR_INCOME, A.FMP_REV),
+            c_text.GP_LAST_Q: v(QUAR_INCOME, A.FMP_GP),
+            c_text.CAPEX_LAST_Y: v(ANN_CF, A.FMP_CAPEX),
+            c_text.NI_LAST_Q: v(QUAR_INCOME, A.FMP_NI),
+            c_text.NI_LAST_Y: v(ANN_INCOME, A.FMP_NI),
+            c_text.NI_TTM: ni_ttm,
+            c_text.EPS_TTM: eps_ttm,
+            c_text.LAST_EX_DIV_DT: v(DIV_CAL, A.FMP_RECORD_DT, 0, None),
+            c_text.LAST_DIV_VAL: v(DIV_CAL, A.FMP_DIV),
+            c_text.ROIC: roic,
+            c_text.PR_TTM: v(RATIO_TTM, A.FMP_DIV_PR_TTM),
+            c_text.NEXT_EARN_DATE: self.earnings(A.FMP_DT, default_value=None),
+            c_text.NEXT_EARN_EST_EPS: self.earnings(A.FMP_EPS_EST),
+            c_text.NEXT_EARN_EST_REV: self.earnings(A.FMP_REV_EST),
+            c_text.BEAT_EST: None if beat_estimate is None else beat_estimate - 1.0,
+            c_text.BEAT_EST_LAST_UPDATE: self.earnings(A.FMP_DT, is_est=False, default_value=None),
+        }
+
+
+def _is_close(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def _projected(data):
+    return {ticker: {k: project_rows(rows) for k, rows in fin_dict.items()} for ticker, fin_dict in data.items()}
+
+
+@pytest.mark.parametrize('null_rate', [0.0, 0.05])
+@pytest.mark.parametrize('source', ['rows', 'store'])
+def test_engine_matches_scalar_reference(tmp_path, source, null_rate):
+    data = gen_financials(120, seed=11, null_rate=null_rate)
+
+    # Tickers may appear in several sheets
+    ticker_ls = list(data) + list(data)[:15]
+
+    if source == 'store':
+        store = StatementStore(str(tmp_path / 'statements'))
+        store.write_financials(_projected(data))
+        engine = MetricsEngine.from_store(store, ticker_ls)
+    else:
+        engine = MetricsEngine(_projected(data), ticker_ls)
+
+    stage_ls = MetricRegistry.compute(engine)
+    value_dict = {col: values for stage in stage_ls for col, values in stage.items()}
+
+    mismatch_ls = []
+    for i, ticker in enumerate(ticker_ls):
+        for col, expected in ScalarReference(data[ticker]).metrics().items():
+            if not _is_close(value_dict[col][i], expected):
+                mismatch_ls.append((ticker, col, value_dict[col][i], expected))
+
+    assert mismatch_ls == []
+
+
+def test_statement_index_positions():
+    A = c_api_text
+    earnings_rows = [
+        {A.FMP_DT: '2026-03-28', A.FMP_REV_EST: 10.0, A.FMP_REV_ACT: None},
+        {A.FMP_DT: '2025-12-28', A.FMP_REV_EST: 9.0, A.FMP_REV_ACT: 9.5},
+    ]
+    engine = MetricsEngine({
+        'AAA': {EARNINGS_CAL: project_rows(earnings_rows), ANN_INCOME: project_rows([{A.FMP_REV: 1.0}])},
+        'BBB': {EARNINGS_CAL: project_rows(earnings_rows[1:])},
+        'CCC': {EARNINGS_CAL: None},
+    }, ['AAA', 'BBB', 'CCC'])
+
+    assert engine.index.earnings_first_pos(is_est=True).tolist() == [0, 0, -1]
+    assert engine.index.earnings_first_pos(is_est=False).tolist() == [1, 0, -1]
+    assert engine.index.row_pos(ANN_INCOME, 0).tolist() == [0, -1, -1]
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from main.util.rate_limiter import RateLimiter
+
+
+def test_concurrent_pauses_do_not_stack(tmp_path):
+    path = str(tmp_path / 'rate_limit.sqlite3')
+    retry_after = 30.0
+
+    # Every worker hit by the same 429 pauses the host, each with its own connection
+    def _pause(_):
+        RateLimiter(path, calls_per_minute=60).pause(retry_after)
+
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(_pause, range(16)))
+
+    # One token a second: the next call waits Retry-After plus the token it consumes, not 16 x Retry-After
+    wait = RateLimiter(path, calls_per_minute=60)._update()
+    assert retry_after <= wait <= retry_after + 2.0
+
+
+def test_pause_keeps_a_longer_pause(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'rate_limit.sqlite3'), calls_per_minute=60)
+    limiter.pause(60.0)
+    limiter.pause(5.0)
+
+    assert limiter._update() >= 60.0
@@ -0,0 +1,71 @@
+import math
+import random
+
+import numpy as np
+
+from main.util.rolling import compact_panel, panel_prefix_sums, panel_window_sum
+
+
+def _direct_sum(values, beg, end):
+    """Sum of values[beg:end] one window at a time, None when a value inside the window is missing."""
+    window = values[beg:end]
+    if any(v is None for v in window):
+        return None
+
+    return sum(window)
+
+
+def _is_close(a, b, values, end):
+    """
+    Equal up to rounding: a prefix difference is off by a few ulps of the prefix sums, not of the window, so the
+    tolerance scales with the magnitude of the values up to the end of the window.
+    """
+    if a is None or b is None:
+        return a is None and b is None
+
+    scale = sum(abs(v) for v in values[:end] if v is not None)
+    return math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-12 * max(scale, 1.0))
+
+
+def _random_values(rng, n, null_rate):
+    # Mixed magnitudes, so the prefix differences round differently from the direct sums
+    return [None if rng.random() < null_rate else rng.choice([1e9, 1.0, 1e-3]) * rng.uniform(-1, 1)
+            for _ in range(n)]
+
+
+def test_panel_window_sum_matches_direct_sum():
+    rng = random.Random(5)
+    for null_rate in (0.0, 0.1):
+        values_ls = [_random_values(rng, rng.randint(0, 12), null_rate) for _ in range(300)]
+        depth = max(len(values) for values in values_ls)
+        n_rows = np.array([len(values) for values in values_ls])
+
+        # Rows past the end of a ticker are NaN too, but count as 0
+        arr = np.full((len(values_ls), depth), np.nan)
+        for i, values in enumerate(values_ls):
+            arr[i, :len(values)] = [np.nan if v is None else v for v in values]
+
+        prefix = panel_prefix_sums(arr, n_rows)
+        for beg in range(0, 14):
+            for n in (1, 4, 5, 10):
+                result = panel_window_sum(prefix, beg, beg + n)
+                for i, values in enumerate(values_ls):
+                    actual = None if np.isnan(result[i]) else float(result[i])
+                    assert _is_close(actual, _direct_sum(values, beg, beg + n), values, beg + n), (i, beg, n)
+
+
+def test_compact_panel_window_sum_over_reported_values():
+    rng = random.Random(7)
+    values_ls = [_random_values(rng, rng.randint(0, 46), 0.3) for _ in range(100)]
+    depth = max(len(values) for values in values_ls)
+
+    arr = np.full((len(values_ls), depth), np.nan)
+    for i, values in enumerate(values_ls):
+        arr[i, :len(values)] = [np.nan if v is None else v for v in values]
+
+    prefix = panel_prefix_sums(*compact_panel(arr))
+    for beg_n, end_n in ((1, 4), (5, 8), (17, 20), (37, 40)):
+        result = panel_window_sum(prefix, beg_n - 1, end_n)
+        for i, values in enumerate(values_ls):
+            reported = [v for v in values if v is not None]
+            assert _is_close(float(result[i]), sum(reported[beg_n - 1:end_n]), reported, end_n), (i, beg_n)
@@ -0,0 +1,55 @@
+import main.util.screen_pipeline as screen_pipeline
+from main.constants import c_api_text, c_text
+from main.constants.c_fin_key import ANN_INCOME, EARNINGS_CAL, RATIO_TTM
+from main.layout.layout_fetch_plan import LayoutFetchPlan
+from main.layout.layout_output_data import LayoutOutputData
+from main.util.screen_pipeline import ScreenPipeline
+from main.util.statement_store import StatementStore
+
+
+def _plan(pipeline):
+    pipeline.prepare_ticker_ls()
+    return LayoutFetchPlan.plan(pipeline.get_output_columns())
+
+
+def test_valuation_only_layout_plans_fewer_requests():
+    full_limits = _plan(ScreenPipeline.from_tickers(us='AAA,BBB'))
+    valuation_limits = _plan(ScreenPipeline.from_tickers(us='AAA,BBB', col_ls=LayoutOutputData.col_valuation_order))
+
+    assert set(valuation_limits) == {RATIO_TTM, EARNINGS_CAL}
+    assert len(valuation_limits) < len(full_limits)
+    assert valuation_limits[EARNINGS_CAL] < full_limits[EARNINGS_CAL]
+    assert ANN_INCOME not in valuation_limits
+
+
+def test_output_columns_follow_the_screened_sheets():
+    value_pipeline = ScreenPipeline.from_tickers(us='AAA', sheetname=c_text.LABEL__VALUE_STOCK)
+    value_pipeline.prepare_ticker_ls()
+    assert value_pipeline.get_output_columns() == LayoutOutputData.col_value_order
+
+    # Every sheet is screened on the full layout, the value sheet columns are a subset of it
+    watchlist_pipeline = ScreenPipeline.from_tickers(us='AAA')
+    watchlist_pipeline.prepare_ticker_ls()
+    assert watchlist_pipeline.get_output_columns() == LayoutOutputData.col_order
+    assert c_text.NI_TTM not in value_pipeline.get_output_columns()
+
+
+def test_failed_fetch_served_from_the_store_is_reported(tmp_path, monkeypatch):
+    store = StatementStore(str(tmp_path))
+    ratio_rows = [{c_api_text.FMP_DT: '2025-09-30', c_api_text.FMP_PE_TTM: 20.0}]
+    store.write(RATIO_TTM, {'AAA': ratio_rows, 'BBB': ratio_rows})
+    monkeypatch.setattr(screen_pipeline, 'get_statement_store', lambda: store)
+
+    pipeline = ScreenPipeline.from_tickers(us='AAA,BBB,CCC', col_ls=LayoutOutputData.col_valuation_order)
+    pipeline.prepare_ticker_ls()
+
+    # BBB's fetch failed and reads the stored rows, CCC's failed with nothing stored
+    pipeline.data_raw_financials.update({
+        'AAA': {RATIO_TTM: ratio_rows, EARNINGS_CAL: []},
+        'BBB': {RATIO_TTM: None, EARNINGS_CAL: []},
+        'CCC': {RATIO_TTM: None, EARNINGS_CAL: []},
+    })
+    pipeline.compute_metrics()
+
+    assert pipeline.stale_ticker_ls == ['BBB']
+    assert pipeline.data_valuation[c_text.TRAILING_PE_TTM] == [20.0, 20.0, 0.0]
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from main.constants import c_api_text
+from main.constants.c_fin_key import DIV_CAL, EARNINGS_CAL
+from main.util.ingest import project_rows
+from main.util.metrics_engine import MetricsEngine
+import main.util.statement_store as statement_store
+from main.util.statement_store import StatementBlock, StatementStore
+
+
+def _div_rows(date_ls, record_dt_ls, div_ls):
+    return [
+        {c_api_text.FMP_DT: date, c_api_text.FMP_RECORD_DT: record_dt, c_api_text.FMP_DIV: div}
+        for date, record_dt, div in zip(date_ls, record_dt_ls, div_ls)
+    ]
+
+
+def test_write_read_round_trip(tmp_path):
+    store = StatementStore(str(tmp_path))
+    store.write(DIV_CAL, {
+        'AAA': project_rows(_div_rows(['2025-03-01', '2024-12-01'], ['2025-03-05', '2024-12-05'], [0.5, 0.4])),
+        'BBB': _div_rows(['2025-02-01'], ['2025-02-05'], [1.0]),
+    })
+
+    table = store.read(DIV_CAL)
+    assert table.schema.field(c_api_text.FMP_DT).type == pa.date32()
+    assert table.schema.field(c_api_text.FMP_RECORD_DT).type == pa.string()
+    assert table.schema.field(c_api_text.FMP_DIV).type == pa.float64()
+
+    block = StatementBlock(store.read_parts(DIV_CAL), ['BBB', 'AAA', 'CCC'])
+    assert block.n_rows.tolist() == [1, 2, 0]
+    assert block.text(c_api_text.FMP_DT, np.array([0, 1, -1]), None).tolist() == ['2025-02-01', '2024-12-01', None]
+
+    engine = MetricsEngine.from_store(store, ['AAA', 'BBB', 'CCC'])
+    assert engine.to_list(engine.value(DIV_CAL, c_api_text.FMP_DIV, idx=0)) == [0.5, 1.0, 0.0]
+    assert engine.to_list(engine.value(DIV_CAL, c_api_text.FMP_RECORD_DT, idx=0, default_value=None, is_num=False)) \
+        == ['2025-03-05', '2025-02-05', None]
+
+
+def test_write_mixed_batches(tmp_path):
+    store = StatementStore(str(tmp_path))
+    store.write(DIV_CAL, {'AAA': _div_rows(['2025-03-01', '2024-12-01'], ['2025-03-05', '2024-12-05'], [0.5, 0.4])})
+
+    # A later batch where the record date is all None
+    store.write(DIV_CAL, {'BBB': _div_rows(['2025-02-01'], [None], [1.0])})
+
+    # A batch with an unparsable date, and a date with a time part
+    store.write(DIV_CAL, {'CCC': _div_rows(['not a date', '2024-11-01 00:00:00'], ['2025-01-05', None], [None, 2.0])})
+
+    # A rewrite of a ticker replaces its rows
+    store.write(DIV_CAL, {'AAA': _div_rows(['2025-06-01'], ['2025-06-05'], [0.6])})
+
+    table = store.read(DIV_CAL)
+    assert table.schema.field(c_api_text.FMP_DT).type == pa.date32()
+    assert table.schema.field(c_api_text.FMP_RECORD_DT).type == pa.string()
+    assert table.schema.field(c_api_text.FMP_DIV).type == pa.float64()
+
+    rows = table.to_pylist()
+    assert [(r['symbol'], r['row']) for r in rows] == [('AAA', 0), ('BBB', 0), ('CCC', 0), ('CCC', 1)]
+    assert [r[c_api_text.FMP_RECORD_DT] for r in rows] == ['2025-06-05', None, '2025-01-05', None]
+    assert [None if r[c_api_text.FMP_DT] is None else r[c_api_text.FMP_DT].isoformat() for r in rows] \
+        == ['2025-06-01', '2025-02-01', None, '2024-11-01']
+    assert np.isnan(rows[2][c_api_text.FMP_DIV]) and rows[3][c_api_text.FMP_DIV] == 2.0
+
+
+def test_write_unprojected_field_inferred_differently(tmp_path):
+    store = StatementStore(str(tmp_path))
+    store.write(EARNINGS_CAL, {'AAA': [{c_api_text.FMP_DT: '2025-03-01', 'note': 1.5}]})
+    store.write(EARNINGS_CAL, {'BBB': [{c_api_text.FMP_DT: '2025-03-01', 'note': 'revised'}]})
+
+    table = store.read(EARNINGS_CAL)
+    assert table.schema.field('note').type == pa.string()
+    assert table['note'].to_pylist() == ['1.5', 'revised']
+
+
+def test_write_appends_a_part_and_keeps_older_parts(tmp_path):
+    store = StatementStore(str(tmp_path))
+    store.write(DIV_CAL, {
+        'AAA': _div_rows(['2025-03-01'], ['2025-03-05'], [0.5]),
+        'BBB': _div_rows(['2025-02-01'], ['2025-02-05'], [1.0]),
+    })
+    first_path = os.path.join(store.dir_path(DIV_CAL), os.listdir(store.dir_path(DIV_CAL))[0])
+    first_mtime = os.stat(first_path).st_mtime_ns
+
+    store.write(DIV_CAL, {'AAA': _div_rows(['2025-06-01', '2025-03-01'], ['2025-06-05', '2025-03-05'], [0.6, 0.5])})
+
+    # The first part is not rewritten, AAA is read from the newest part
+    assert os.stat(first_path).st_mtime_ns == first_mtime
+    assert len(store.read_parts(DIV_CAL)) == 2
+
+    engine = MetricsEngine.from_store(store, ['AAA', 'BBB'])
+    assert engine.n_rows(DIV_CAL).tolist() == [2, 1]
+    assert engine.to_list(engine.value(DIV_CAL, c_api_text.FMP_DIV, idx=0)) == [0.6, 1.0]
+    assert engine.to_list(engine.value(DIV_CAL, c_api_text.FMP_RECORD_DT, idx=0, default_value=None, is_num=False)) \
+        == ['2025-06-05', '2025-02-05']
+
+
+def test_parts_are_merged_past_max_part(tmp_path, monkeypatch):
+    monkeypatch.setattr(statement_store, 'MAX_PART', 3)
+    store = StatementStore(str(tmp_path))
+    for i in range(5):
+        store.write(DIV_CAL, {f'T{i % 2}': _div_rows(['2025-03-01'], ['2025-03-05'], [float(i)])})
+
+    part_ls = store.read_parts(DIV_CAL)
+    assert len(part_ls) <= 3
+    assert store.read(DIV_CAL)[c_api_text.FMP_DIV].to_pylist() == [4.0, 3.0]
+
+
+def test_contiguous_columns_are_sliced_without_copy(tmp_path):
+    store = StatementStore(str(tmp_path))
+    store.write(DIV_CAL, {t: _div_rows(['2025-03-01'], ['2025-03-05'], [1.0]) for t in ['AAA', 'BBB', 'CCC']})
+    part_ls = store.read_parts(DIV_CAL)
+
+    # The universe is the whole part: a view on the mapped buffer
+    values, _, _ = next(StatementBlock(part_ls, ['AAA', 'BBB', 'CCC']).columns(c_api_text.FMP_DIV))
+    assert not values.flags.owndata
+
+    # A gap in the universe takes the rows instead
+    values, ticker_idx, _ = next(StatementBlock(part_ls, ['CCC', 'AAA']).columns(c_api_text.FMP_DIV))
+    assert values.tolist() == [1.0, 1.0] and ticker_idx.tolist() == [1, 0]
@@ -0,0 +1,31 @@
+from io import BytesIO
+
+import numpy as np
+import xlsxwriter
+
+from main.constants import c_text
+from main.data.condition_container import ConditionContainer
+from main.util.writer import FormatCache, Writer
+
+
+class RecordingSheet:
+    def __init__(self):
+        self.rule_ls = []
+
+    def conditional_format(self, first_row, first_col, last_row, last_col, options):
+        self.rule_ls.append(((first_row, first_col, last_row, last_col), options['criteria']))
+
+
+def test_conditional_formatting_thresholds():
+    col_order_ls = [c_text.DIV_YIELD_TTM, c_text.CAPEX_NI_TTM, c_text.EPS_CAGR_TTM, c_text.GM_LAST_Q, c_text.GM_TTM]
+    condition = ConditionContainer(div=np.float64(0.03), capex=float('inf'), eps=float('nan'), gm=np.int64(1))
+
+    ws = RecordingSheet()
+    fmt_cache = FormatCache(xlsxwriter.Workbook(BytesIO(), {'in_memory': True}))
+    Writer.apply_conditional_formatting(ws, col_order_ls, condition, 2, 5, fmt_cache)
+
+    # Numpy scalars are written as plain numbers, thresholds that are not finite add no rule
+    assert ws.rule_ls == [
+        ((2, 0, 5, 0), '=AND(ISNUMBER(A3),A3>0.03)'),
+        ((2, 3, 5, 4), '=AND(ISNUMBER(D3),D3>1.0)'),
+    ]